@@ -0,0 +1,501 @@
+"""
+Author      : Matt Guillory & Jackson Crewe
+Class       : HMC CS 158
+Date        : 2018 Feb 14
+Description : Twitter benchmarks
+
+Times the stages of the twitter.py pipeline on synthetic corpora of
+increasing size:
+
+    python benchmark.py generate [--sizes 1e3,1e4,1e5]
+    python benchmark.py run [--sizes 1e3,1e4,1e5] [-o results.json] [--compare BASELINE]
+    python benchmark.py compare BASELINE CURRENT [--tolerance 0.1]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from collections import OrderedDict
+import traceback
+from multiprocessing import Process, Pipe, cpu_count
+
+# numpy and scipy libraries
+import numpy as np
+import scipy
+
+# scikit-learn libraries
+import sklearn
+from sklearn.linear_model import SGDClassifier
+from sklearn.model_selection import StratifiedKFold
+
+import twitter
+
+######################################################################
+# functions -- synthetic corpus
+######################################################################
+
+def corpus_statistics(infile, labelfile) :
+    """
+    Measures the statistics of a labeled corpus that generate_corpus
+    reproduces.
+    
+    Parameters
+    --------------------
+        infile     -- string, filename of tweets, one per line
+        labelfile  -- string, filename of labels {1,-1}, one per line
+    
+    Returns
+    --------------------
+        stats      -- dictionary with
+                        words      -- list of strings, vocabulary by decreasing frequency
+                        counts     -- numpy array of shape (2,V), occurrences of
+                                      each word in negative and positive tweets
+                        lengths    -- numpy array of shape (n,), words per tweet
+                        pos_rate   -- float, fraction of positive tweets
+                        zipf       -- float, exponent s of the rank-frequency law
+                                      f(r) ~ r^-s
+                        heaps      -- pair of floats (K, beta) of the vocabulary
+                                      growth law V(N) = K N^beta
+                        unseen     -- float, Good-Turing estimate of the
+                                      probability mass of unseen words
+    """
+    
+    labels = twitter.read_vector_file(labelfile, dtype=np.int8)
+    counts = [{}, {}]
+    lengths = []
+    growth = []
+    vocabulary = set()
+    n_tokens = 0
+    row = 0
+    for lines in twitter.iter_lines(infile) :
+        for words in twitter.extract_words_batch(lines) :
+            side = counts[int(labels[row] == 1)]
+            for word in words :
+                side[word] = side.get(word, 0) + 1
+            vocabulary.update(words)
+            n_tokens += len(words)
+            lengths.append(len(words))
+            growth.append((n_tokens, len(vocabulary)))
+            row += 1
+    
+    total = dict((word, counts[0].get(word, 0) + counts[1].get(word, 0)) for word in vocabulary)
+    words = sorted(vocabulary, key=lambda word: (-total[word], word))
+    freqs = np.array([total[word] for word in words], dtype=float)
+    
+    ranks = np.arange(1, len(words) + 1)
+    zipf = -np.polyfit(np.log(ranks), np.log(freqs), 1)[0]
+    # skip the first tweets, whose vocabulary grows faster than the law
+    growth = np.array(growth[len(growth) // 10:], dtype=float)
+    beta, log_K = np.polyfit(np.log(growth[:, 0]), np.log(growth[:, 1]), 1)
+    
+    return {'words': words,
+            'counts': np.array([[side.get(word, 0) for word in words] for side in counts]),
+            'lengths': np.array(lengths),
+            'pos_rate': np.mean(labels == 1),
+            'zipf': zipf,
+            'heaps': (np.exp(log_K), beta),
+            'unseen': np.sum(freqs == 1) / float(n_tokens)}
+
+
+def _synthetic_word(rank) :
+    """Returns a made-up lowercase word for a rank beyond the real vocabulary."""
+    letters = []
+    while True :
+        rank, digit = divmod(rank, 26)
+        letters.append(chr(ord('a') + digit))
+        if rank == 0 :
+            break
+    return 'zq' + ''.join(letters)
+
+
+def generate_corpus(stats, n_lines, outfile, labelfile, random_state=0,
+                    chunk_size=100000) :
+    """
+    Writes a synthetic labeled corpus with the statistics of a real one.
+    
+    Each tweet gets a label drawn with the real positive rate and a length
+    drawn from the real lengths. Its words are drawn independently. The
+    real vocabulary keeps its per-class frequencies. The vocabulary grows
+    with the corpus as the real one does: by Heaps' law, n_lines tweets
+    have about V(N) distinct words, where N is their expected number of
+    words. The words beyond the real vocabulary get the Good-Turing unseen
+    mass, and that mass is spread over their ranks by the real Zipf
+    exponent.
+    
+    Parameters
+    --------------------
+        stats        -- dictionary, output of corpus_statistics
+        n_lines      -- int, number of tweets
+        outfile      -- string, filename of tweets
+        labelfile    -- string, filename of labels
+        random_state -- int, seed; a seed and size always give the same corpus
+        chunk_size   -- int, number of tweets generated at a time
+    """
+    
+    rng = np.random.RandomState(random_state)
+    words, counts = stats['words'], stats['counts']
+    lengths = stats['lengths']
+    K, beta = stats['heaps']
+    
+    n_real = len(words)
+    n_words = max(n_real, int(K * (n_lines * lengths.mean()) ** beta))
+    if n_words > n_real :
+        tail = np.arange(n_real + 1, n_words + 1, dtype=float) ** -stats['zipf']
+        tail *= stats['unseen'] / tail.sum()
+    else :
+        tail = np.zeros(0)
+    vocabulary = np.array(words + [_synthetic_word(r) for r in range(n_real, n_words)],
+                          dtype=object)
+    
+    # one cumulative distribution over the whole vocabulary per class
+    cdfs = []
+    for side in counts :
+        head = side / float(side.sum()) * (1 - tail.sum())
+        cdf = np.cumsum(np.concatenate([head, tail]))
+        cdfs.append(cdf / cdf[-1])
+    
+    with open(outfile, 'w') as fid, open(labelfile, 'w') as label_fid :
+        for start in range(0, n_lines, chunk_size) :
+            m = min(chunk_size, n_lines - start)
+            labels = np.where(rng.random_sample(m) < stats['pos_rate'], 1, -1)
+            sizes = rng.choice(lengths, m)
+            ids = np.empty(sizes.sum(), dtype=np.intp)
+            owner = np.repeat(labels, sizes)
+            for label, cdf in zip((-1, 1), cdfs) :
+                mask = owner == label
+                ids[mask] = np.searchsorted(cdf, rng.random_sample(mask.sum()), side='right')
+            tokens = vocabulary[np.minimum(ids, n_words - 1)]
+    
+            ends = np.cumsum(sizes)
+            fid.write(''.join(' '.join(tokens[end - size:end]) + '\n'
+                              for size, end in zip(sizes, ends)))
+            label_fid.write(''.join('%d\n' % label for label in labels))
+
+
+def corpus_files(corpus_dir, n_lines) :
+    """Returns the tweet and label filenames of the synthetic corpus of n_lines tweets."""
+    return (os.path.join(corpus_dir, 'tweets-%d.txt' % n_lines),
+            os.path.join(corpus_dir, 'labels-%d.txt' % n_lines))
+
+
+def ensure_corpus(stats, corpus_dir, n_lines, random_state=0) :
+    """Generates the synthetic corpus of n_lines tweets unless it already exists."""
+    infile, labelfile = corpus_files(corpus_dir, n_lines)
+    if not (os.path.exists(infile) and os.path.exists(labelfile)) :
+        if not os.path.isdir(corpus_dir) :
+            os.makedirs(corpus_dir)
+        # write under temporary names so an interrupted run is not mistaken
+        # for a complete corpus
+        generate_corpus(stats, n_lines, infile + '.tmp', labelfile + '.tmp', random_state)
+        os.rename(labelfile + '.tmp', labelfile)
+        os.rename(infile + '.tmp', infile)
+    return infile, labelfile
+
+
+######################################################################
+# functions -- stages
+######################################################################
+
+# parameter grid of the cv_sweep stage, one linear and one RBF setting per C
+SWEEP_GRID = [{'kernel': 'linear', 'C': C} for C in (0.1, 1.0)] + \
+             [{'kernel': 'rbf', 'C': C, 'gamma': 0.01} for C in (1.0, 100.0)]
+
+STAGES = ["tokenize", "dictionary", "features", "dictionary_and_features",
+          "parallel_features", "hashed_features", "cv_sweep", "bootstrap"]
+
+def _head(infile, labelfile, n_lines) :
+    """Returns the features and labels of the first n_lines tweets."""
+    lines = []
+    for chunk in twitter.iter_lines(infile) :
+        lines.extend(chunk[:n_lines - len(lines)])
+        if len(lines) == n_lines :
+            break
+    X = twitter.lines_to_csr(lines, {}, grow=True)
+    y = twitter.read_vector_file(labelfile, dtype=np.int8)[:len(lines)]
+    return X, y
+
+
+def _run_stage(job) :
+    """
+    Runs one stage on one corpus in a worker process and returns its
+    measurements. Inputs of the stage are prepared before timing starts.
+    """
+    stage, infile, labelfile, n_lines, options = job
+    profiler = twitter.PROFILER
+    profiler.reset()
+    profiler.enable(memory=True)
+    rows = n_lines
+    
+    if stage == "tokenize" :
+        with profiler.stage(stage) :
+            for lines in twitter.iter_lines(infile) :
+                twitter.extract_words_batch(lines)
+    elif stage == "dictionary" :
+        with profiler.stage(stage) :
+            twitter.extract_dictionary(infile)
+    elif stage == "features" :
+        word_list = twitter.extract_dictionary(infile)
+        with profiler.stage(stage) :
+            twitter.extract_feature_vectors(infile, word_list)
+    elif stage == "dictionary_and_features" :
+        with profiler.stage(stage) :
+            twitter.extract_dictionary_and_features(infile)
+    elif stage == "parallel_features" :
+        with profiler.stage(stage) :
+            twitter.extract_features_parallel(infile, options['n_jobs'])
+    elif stage == "hashed_features" :
+        with profiler.stage(stage) :
+            twitter.extract_hashed_feature_vectors(infile)
+    elif stage == "cv_sweep" :
+        # SVC training is superlinear in the number of examples
+        rows = min(n_lines, options['max_cv'])
+        X, y = _head(infile, labelfile, rows)
+        with profiler.stage(stage) :
+            twitter.cv_grid_performance(SWEEP_GRID, X, y, StratifiedKFold(5), twitter.METRICS,
+                                        options['n_jobs'])
+    elif stage == "bootstrap" :
+        rows = min(n_lines, options['max_bootstrap'])
+        X, y = _head(infile, labelfile, rows)
+        clf = SGDClassifier(loss='hinge', max_iter=50, tol=1e-3, random_state=0).fit(X, y)
+        y_pred = clf.decision_function(X)
+        np.random.seed(1234)
+        with profiler.stage(stage) :
+            twitter.bootstrap_performance(y, y_pred, twitter.METRICS)
+    else :
+        raise ValueError("unknown stage %r" % stage)
+    
+    record = OrderedDict([('size', n_lines), ('stage', stage), ('rows', rows)])
+    record.update(profiler.stages[stage])
+    record['rows_per_second'] = rows / max(record['seconds'], 1e-9)
+    record['counters'] = profiler.counters
+    return record
+
+
+def _child_main(conn, func, args) :
+    """Runs func(*args) and sends ('ok', result) or ('error', traceback) to conn."""
+    try :
+        reply = ('ok', func(*args))
+    except BaseException :
+        reply = ('error', traceback.format_exc())
+    conn.send(reply)
+    conn.close()
+
+
+def _in_child(func, *args) :
+    """
+    Runs func(*args) in a fresh process, so that its peak memory is not
+    inflated by what earlier stages allocated. The process is not a pool
+    worker, so the stage may open a Pool of its own (n_jobs > 1).
+    """
+    parent, child = Pipe(duplex=False)
+    proc = Process(target=_child_main, args=(child, func, args))
+    proc.start()
+    child.close()
+    try :
+        status, result = parent.recv()
+    except EOFError :
+        proc.join()
+        raise RuntimeError("stage process exited with code %s" % proc.exitcode)
+    proc.join()
+    if status != 'ok' :
+        raise RuntimeError("stage process failed:\n%s" % result)
+    return result
+
+
+def _metadata() :
+    """Returns the environment that a set of results was measured in."""
+    try :
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError) :
+        commit = None
+    return OrderedDict([('time', time.strftime('%Y-%m-%d %H:%M:%S')),
+                        ('commit', commit),
+                        ('platform', platform.platform()),
+                        ('python', platform.python_version()),
+                        ('numpy', np.__version__),
+                        ('scipy', scipy.__version__),
+                        ('sklearn', sklearn.__version__),
+                        ('cpu_count', cpu_count())])
+
+
+def run_benchmarks(sizes, stages=STAGES, corpus_dir='../data/bench', repeat=1,
+                   source=('../data/tweets.txt', '../data/labels.txt'),
+                   random_state=0, n_jobs=-1, max_cv=2000, max_bootstrap=20000) :
+    """
+    Times every stage on a synthetic corpus of every size.
+    
+    Each run of a stage happens in its own worker process. A stage's time
+    is the fastest of its repeat runs, and its peak memory the largest.
+    
+    Parameters
+    --------------------
+        sizes         -- list of ints, numbers of tweets
+        stages        -- list of strings, stages to run (see STAGES)
+        corpus_dir    -- string, directory of the synthetic corpora
+        repeat        -- int, number of runs of each stage
+        source        -- pair of strings, tweets and labels to imitate
+        random_state  -- int, seed of the corpus generator
+        n_jobs        -- int, number of worker processes of the parallel stages
+        max_cv        -- int, maximum number of tweets in the cv_sweep stage
+        max_bootstrap -- int, maximum number of tweets in the bootstrap stage
+    
+    Returns
+    --------------------
+        results       -- dictionary with the environment ('meta') and one
+                         record per size and stage ('results')
+    """
+    
+    stats = corpus_statistics(*source)
+    options = {'n_jobs': n_jobs, 'max_cv': max_cv, 'max_bootstrap': max_bootstrap}
+    records = []
+    for n_lines in sizes :
+        infile, labelfile = _in_child(ensure_corpus, stats, corpus_dir, n_lines, random_state)
+        for stage in stages :
+            runs = [_in_child(_run_stage, (stage, infile, labelfile, n_lines, options))
+                    for _ in range(repeat)]
+            record = min(runs, key=lambda run: run['seconds'])
+            record['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+            record['peak_rss_growth_mb'] = max(run['peak_rss_growth_mb'] for run in runs)
+            record['repeat'] = repeat
+            records.append(record)
+            print '%9d  %-24s %10.3fs %14.0f rows/s %9.1f MB' % \
+                (n_lines, stage, record['seconds'], record['rows_per_second'],
+                 record['peak_rss_growth_mb'])
+            sys.stdout.flush()
+    
+    return OrderedDict([('meta', _metadata()), ('results', records)])
+
+
+######################################################################
+# functions -- comparison
+######################################################################
+
+def compare_results(baseline, current, tolerance=0.1) :
+    """
+    Compares two sets of results, size by size and stage by stage.
+    
+    Parameters
+    --------------------
+        baseline    -- dictionary, output of run_benchmarks
+        current     -- dictionary, output of run_benchmarks
+        tolerance   -- float, relative slowdown (or growth of peak memory)
+                       tolerated before a stage counts as a regression
+    
+    Returns
+    --------------------
+        rows        -- list of (size, stage, baseline seconds, current
+                       seconds, baseline MB, current MB, regressed) tuples
+                       for the stages measured in both
+    """
+    
+    previous = dict(((r['size'], r['stage']), r) for r in baseline['results'])
+    rows = []
+    for record in current['results'] :
+        old = previous.get((record['size'], record['stage']))
+        if old is None :
+            continue
+        regressed = (record['seconds'] > old['seconds'] * (1 + tolerance) or
+                     record['peak_rss_growth_mb'] > old['peak_rss_growth_mb'] * (1 + tolerance) + 1)
+        rows.append((record['size'], record['stage'], old['seconds'], record['seconds'],
+                     old['peak_rss_growth_mb'], record['peak_rss_growth_mb'], regressed))
+    return rows
+
+
+def print_comparison(rows) :
+    print '%9s  %-24s %10s %10s %8s %9s %9s' % \
+        ('size', 'stage', 'before', 'after', 'speedup', 'MB before', 'MB after')
+    for size, stage, old, new, old_mb, new_mb, regressed in rows :
+        print '%9d  %-24s %9.3fs %9.3fs %7.2fx %9.1f %9.1f%s' % \
+            (size, stage, old, new, old / max(new, 1e-9), old_mb, new_mb,
+             '  REGRESSION' if regressed else '')
+
+
+######################################################################
+# main
+######################################################################
+
+def _sizes(text) :
+    """Parses a comma-separated list of sizes, e.g. '1e3,1e4'."""
+    return [int(float(size)) for size in text.split(',')]
+
+
+def main(argv=None) :
+    parser = argparse.ArgumentParser(prog='benchmark.py',
+                                     description='Benchmark the twitter.py pipeline.')
+    subparsers = parser.add_subparsers(dest='command')
+    
+    generate = subparsers.add_parser('generate', help='write synthetic corpora')
+    run = subparsers.add_parser('run', help='time every stage at every size')
+    for sub in (generate, run) :
+        sub.add_argument('--sizes', type=_sizes, default=[1000, 10000, 100000],
+                         help='comma-separated numbers of tweets (default: 1e3,1e4,1e5)')
+        sub.add_argument('--corpus-dir', default='../data/bench',
+                         help='directory of the synthetic corpora')
+        sub.add_argument('--seed', type=int, default=0,
+                         help='seed of the corpus generator')
+    run.add_argument('--stages', type=lambda text: text.split(','), default=STAGES,
+                     help='comma-separated stages (default: %s)' % ','.join(STAGES))
+    run.add_argument('--repeat', type=int, default=1,
+                     help='runs of each stage; the fastest is kept')
+    run.add_argument('--n-jobs', type=int, default=-1,
+                     help='worker processes of the parallel stages')
+    run.add_argument('--max-cv', type=int, default=2000,
+                     help='maximum number of tweets in the cv_sweep stage')
+    run.add_argument('--max-bootstrap', type=int, default=20000,
+                     help='maximum number of tweets in the bootstrap stage')
+    run.add_argument('-o', '--output', default='../data/bench/benchmark.json',
+                     help='results file (default: ../data/bench/benchmark.json)')
+    run.add_argument('--compare', metavar='BASELINE',
+                     help='compare the results with an earlier results file')
+    run.add_argument('--tolerance', type=float, default=0.1,
+                     help='relative slowdown counted as a regression')
+    
+    compare = subparsers.add_parser('compare', help='compare two results files')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--tolerance', type=float, default=0.1,
+                         help='relative slowdown counted as a regression')
+    args = parser.parse_args(argv)
+    
+    if args.command == 'generate' :
+        stats = corpus_statistics('../data/tweets.txt', '../data/labels.txt')
+        for n_lines in args.sizes :
+            print ensure_corpus(stats, args.corpus_dir, n_lines, args.seed)[0]
+        return 0
+    
+    if args.command == 'run' :
+        for stage in args.stages :
+            if stage not in STAGES :
+                parser.error('unknown stage %r' % stage)
+        current = run_benchmarks(args.sizes, args.stages, args.corpus_dir, args.repeat,
+                                 random_state=args.seed, n_jobs=args.n_jobs,
+                                 max_cv=args.max_cv, max_bootstrap=args.max_bootstrap)
+        output_dir = os.path.dirname(args.output)
+        if output_dir and not os.path.isdir(output_dir) :
+            os.makedirs(output_dir)
+        with open(args.output, 'w') as fid :
+            json.dump(current, fid, indent=2)
+            fid.write('\n')
+        if args.compare is None :
+            return 0
+        with open(args.compare) as fid :
+            baseline = json.load(fid)
+    else :
+        with open(args.baseline) as fid :
+            baseline = json.load(fid)
+        with open(args.current) as fid :
+            current = json.load(fid)
+    
+    rows = compare_results(baseline, current, args.tolerance)
+    print_comparison(rows)
+    # a non-zero exit status lets scripts fail on a regression
+    return int(any(row[-1] for row in rows))
+
+
+if __name__ == "__main__" :
+    sys.exit(main())
@@ -5,426 +5,2858 @@ Date        : 2018 Feb 14
 Description : Twitter
 """
 
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import cPickle as pickle
+import shutil
+import hashlib
+import tempfile
+import cProfile
+import pstats
+import resource
+from collections import OrderedDict
+from contextlib import contextmanager
 from string import punctuation
+from zlib import crc32
+from itertools import izip_longest
+from multiprocessing import Pool, cpu_count
 
-# numpy libraries
+# numpy and scipy libraries
 import numpy as np
+from scipy import sparse
 
-# matplotlib libraries
-import matplotlib.pyplot as plt
+# scikit-learn is imported by the functions that train classifiers, so that
+# scoring tweets with a saved model does not pay for importing it
+
+######################################################################
+# classes -- profiling
+######################################################################
+
+def _peak_rss_mb(who=None) :
+    """Returns the peak resident set size of this process (or its children) in MB."""
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # ru_maxrss is in kilobytes on Linux and in bytes on OS X
+    return usage.ru_maxrss / (1024. ** 2 if sys.platform == 'darwin' else 1024.)
+
+
+class _NoTimer(object) :
+    """Context manager that does nothing, used while profiling is disabled."""
+    
+    def __enter__(self) :
+        return self
+    
+    def __exit__(self, *exc_info) :
+        return False
+
+_NO_TIMER = _NoTimer()
+
+
+class Profiler(object) :
+    """
+    Timers, counters and per-stage measurements for one run of the pipeline.
+    
+    Timers accumulate the number of calls, total and maximum wall time of a
+    named block of code (e.g. every SVC fit inside cross-validation).
+    Stages are coarse steps of a run (feature extraction, a parameter
+    sweep, bootstrapping, ...); each records its wall and CPU time and,
+    optionally, the growth of peak memory and a cProfile capture.
+    
+    While disabled, timer and stage return a shared context manager that
+    does nothing and count returns immediately, so instrumented code costs
+    one method call per block.
+    
+    Timers and counters updated inside grid search workers are sent back
+    with the job results and merged (see _map_jobs).
+    """
+    
+    def __init__(self) :
+        self.enabled = False
+        self.memory = False
+        self.profile_dir = None
+        self.reset()
+    
+    def reset(self) :
+        """Discards all measurements."""
+        self.timers = OrderedDict()
+        self.counters = OrderedDict()
+        self.stages = OrderedDict()
+        self._profiling = False
+    
+    def enable(self, memory=False, profile_dir=None) :
+        """
+        Parameters
+        --------------------
+            memory      -- boolean, record the peak memory of every stage
+            profile_dir -- string, directory to write a cProfile capture of
+                           every stage to (<stage>.prof), or None
+        """
+        self.enabled = True
+        self.memory = memory
+        self.profile_dir = profile_dir
+        if profile_dir is not None and not os.path.isdir(profile_dir) :
+            os.makedirs(profile_dir)
+    
+    def disable(self) :
+        self.enabled = False
+    
+    def timer(self, name) :
+        """Returns a context manager that adds the time spent in it to timer name."""
+        if not self.enabled :
+            return _NO_TIMER
+        return self._timed(name)
+    
+    def stage(self, name) :
+        """Returns a context manager that measures the stage name."""
+        if not self.enabled :
+            return _NO_TIMER
+        return self._staged(name)
+    
+    def add(self, name, seconds) :
+        """Adds one call taking seconds to timer name."""
+        self.merge({name: {'calls': 1, 'seconds': seconds, 'max_seconds': seconds}}, {})
+    
+    def count(self, name, n=1) :
+        """Adds n to counter name."""
+        if self.enabled :
+            self.counters[name] = self.counters.get(name, 0) + n
+    
+    def merge(self, timers, counters) :
+        """Adds timers and counters recorded by another process."""
+        for name, timer in timers.items() :
+            total = self.timers.get(name)
+            if total is None :
+                total = self.timers[name] = {'calls': 0, 'seconds': 0., 'max_seconds': 0.}
+            total['calls'] += timer['calls']
+            total['seconds'] += timer['seconds']
+            total['max_seconds'] = max(total['max_seconds'], timer['max_seconds'])
+        for name, n in counters.items() :
+            self.counters[name] = self.counters.get(name, 0) + n
+    
+    @contextmanager
+    def _timed(self, name) :
+        start = time.time()
+        try :
+            yield
+        finally :
+            self.add(name, time.time() - start)
+    
+    @contextmanager
+    def _staged(self, name) :
+        record = OrderedDict()
+        # stages do not nest under cProfile; an inner stage is only timed
+        profiler = None
+        if self.profile_dir is not None and not self._profiling :
+            profiler = cProfile.Profile()
+            self._profiling = True
+        rss = _peak_rss_mb() if self.memory else None
+        start, start_cpu = time.time(), time.clock()
+        if profiler is not None :
+            profiler.enable()
+        try :
+            yield
+        finally :
+            if profiler is not None :
+                profiler.disable()
+                self._profiling = False
+            record['seconds'] = time.time() - start
+            record['cpu_seconds'] = time.clock() - start_cpu
+            if rss is not None :
+                peak = _peak_rss_mb()
+                record['peak_rss_mb'] = peak
+                record['peak_rss_growth_mb'] = peak - rss
+                record['children_peak_rss_mb'] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+            if profiler is not None :
+                path = os.path.join(self.profile_dir, '%s.prof' % name)
+                profiler.dump_stats(path)
+                record['profile'] = path
+                record['top_functions'] = self._top_functions(profiler)
+            self.stages[name] = record
+    
+    @staticmethod
+    def _top_functions(profiler, n=20) :
+        """Returns the n functions with the largest cumulative time."""
+        stats = pstats.Stats(profiler).stats
+        top = sorted(stats.items(), key=lambda item: -item[1][3])[:n]
+        return [{'function': '%s:%d(%s)' % func, 'calls': nc,
+                 'seconds': tt, 'cumulative_seconds': ct}
+                for func, (cc, nc, tt, ct, callers) in top]
+    
+    def report(self) :
+        """Returns all measurements as a JSON-serializable dictionary."""
+        timers = OrderedDict()
+        for name, timer in self.timers.items() :
+            timers[name] = dict(timer, mean_seconds=timer['seconds'] / timer['calls'])
+        report = OrderedDict([('stages', self.stages), ('timers', timers),
+                              ('counters', self.counters)])
+        if self.memory :
+            report['peak_rss_mb'] = _peak_rss_mb()
+            report['children_peak_rss_mb'] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+        return report
+    
+    def write(self, fname) :
+        """Writes the report to fname as JSON."""
+        with open(fname, 'w') as fid :
+            json.dump(self.report(), fid, indent=2)
+            fid.write('\n')
+
+# measurements of the current run; see main's --report option
+PROFILER = Profiler()
 
-# scikit-learn libraries
-from sklearn.dummy import DummyClassifier
-from sklearn.svm import SVC
-from sklearn.model_selection import StratifiedKFold
-from sklearn import metrics
-from sklearn.utils import shuffle
 
 ######################################################################
 # functions -- input/output
 ######################################################################
 
-def read_vector_file(fname) :
+def read_vector_file(fname, dtype=np.float64) :
+    """
+    Reads and returns a vector from a file.
+    
+    Parameters
+    --------------------
+        fname  -- string, filename
+        dtype  -- numpy dtype of the result (e.g. np.int8 for {1,-1} labels)
+    
+    Returns
+    --------------------
+        labels -- numpy array of shape (n,)
+                    n is the number of non-blank lines in the text file
+    """
+    chunks = list(iter_vector_file(fname, dtype=dtype))
+    if not chunks :
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(chunks)
+
+
+def _split_lines(pieces) :
+    """
+    Splits a stream of text pieces into lines on '\n', '\r\n' or '\r',
+    each ending in '\n'. A line may span several pieces; only the part of it
+    read so far is held.
+    """
+    partial = ''
+    for piece in pieces :
+        text = partial + piece
+        # a trailing '\r' may be the first half of a '\r\n' split across pieces
+        cut = len(text) - 1 if text.endswith('\r') else len(text)
+        lines = text[:cut].replace('\r\n', '\n').replace('\r', '\n').splitlines(True)
+        partial = text[cut:]
+        if lines and not lines[-1].endswith('\n') :
+            partial = lines.pop() + partial
+        for line in lines :
+            yield line
+    if partial :
+        yield partial[:-1] + '\n' if partial.endswith('\r') else partial
+
+
+def iter_lines(infile, chunk_size=10000, block_size=1 << 16) :
+    """
+    Reads a text file lazily, yielding its lines in chunks so that only one
+    chunk is held in memory at a time.
+    
+    Parameters
+    --------------------
+        infile     -- string, filename, or an open file object
+        chunk_size -- int, maximum number of lines per chunk
+        block_size -- int, maximum number of bytes read from a file object
+                      at a time
+    
+    Returns
+    --------------------
+        lines      -- generator of lists of at most chunk_size strings
+    """
+    
+    if hasattr(infile, 'readline') :
+        # readline rather than iteration, so that interactive input (e.g.
+        # stdin) is not held back by the file iterator's read-ahead buffer;
+        # readline only splits on '\n' and a file with '\r' line endings has
+        # none, so it reads at most block_size bytes at a time, and the
+        # pieces are split with universal newlines as open(infile, 'rU') does
+        fid = infile
+        source = _split_lines(iter(lambda : fid.readline(block_size), ''))
+    else :
+        fid = source = open(infile, 'rU')
+    try :
+        lines = []
+        for line in source :
+            lines.append(line)
+            if len(lines) == chunk_size :
+                yield lines
+                lines = []
+        if lines :
+            yield lines
+    finally :
+        if fid is not infile :
+            fid.close()
+
+
+def iter_vector_file(fname, chunk_size=10000, dtype=np.float64) :
+    """
+    Reads a vector from a file lazily, in chunks of chunk_size lines.
+    
+    Parameters
+    --------------------
+        fname      -- string, filename
+        chunk_size -- int, maximum number of lines per chunk
+        dtype      -- numpy dtype of the chunks
+    
+    Returns
+    --------------------
+        labels     -- generator of numpy arrays of shape (m,)
+                        m <= chunk_size, blank lines are skipped
+    """
+    
+    for lines in iter_lines(fname, chunk_size) :
+        yield np.array([float(line) for line in lines if line.strip()]).astype(dtype)
+
+
+def write_label_answer(vec, outfile) :
+    """
+    Writes your label vector to the given file.
+    
+    Parameters
+    --------------------
+        vec     -- numpy array of shape (n,) or (n,1), predicted scores
+        outfile -- string, output filename
+    """
+    
+    # for this project, you should predict 70 labels
+    if(vec.shape[0] != 70):
+        print("Error - output vector should have 70 rows.")
+        print("Aborting write.")
+        return
+    
+    np.savetxt(outfile, vec)    
+
+
+def pack_tokens(tokens) :
+    """
+    Packs a list of strings into one byte buffer and an offsets array, so
+    that each string takes only its own length (a fixed-width string array
+    would take the length of the longest string for every entry).
+    
+    Parameters
+    --------------------
+        tokens  -- list of strings
+    
+    Returns
+    --------------------
+        buffer  -- numpy array of shape (total length,), dtype uint8, the
+                   strings concatenated
+        offsets -- numpy array of shape (len(tokens)+1,), dtype int64, the
+                   i-th string is buffer[offsets[i]:offsets[i+1]]
+    """
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(token) for token in tokens])
+    buffer = np.frombuffer(''.join(tokens), dtype=np.uint8)
+    return buffer, offsets
+
+
+def unpack_tokens(buffer, offsets) :
+    """Returns the list of strings packed by pack_tokens (arrays may be memory maps)."""
+    data = np.asarray(buffer).tostring()
+    offsets = np.asarray(offsets).tolist()
+    return [data[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+######################################################################
+# functions -- feature extraction
+######################################################################
+
+# a word is either a single punctuation mark or a maximal run of characters
+# that are neither whitespace nor punctuation; this matches padding every
+# punctuation mark with spaces and splitting on whitespace
+_WORD_RE = re.compile(r'[%s]|[^\s%s]+' % (re.escape(punctuation),
+                                          re.escape(punctuation)))
+
+def extract_words(input_string) :
+    """
+    Processes the input_string, separating it into "words" based on the presence
+    of spaces, and separating punctuation marks into their own words.
+    
+    Parameters
+    --------------------
+        input_string -- string of characters
+    
+    Returns
+    --------------------
+        words        -- list of lowercase "words"
+    """
+    
+    return _WORD_RE.findall(input_string.lower())
+
+
+def extract_words_batch(lines) :
+    """
+    Processes a list of strings with extract_words.
+    
+    Parameters
+    --------------------
+        lines -- list of strings
+    
+    Returns
+    --------------------
+        words -- list of lists of lowercase "words", one list per line
+    """
+    
+    findall = _WORD_RE.findall
+    return [findall(line.lower()) for line in lines]
+
+
+def extract_dictionary(infile) :
+    """
+    Given a filename, reads the text file and builds a dictionary of unique
+    words/punctuations.
+    
+    Parameters
+    --------------------
+        infile    -- string, filename
+    
+    Returns
+    --------------------
+        word_list -- dictionary, (key, value) pairs are (word, index)
+    """
+    
+    word_list = {}
+    index = 0
+    for lines in iter_lines(infile) :
+        for words in extract_words_batch(lines) :
+            for i in range(len(words)):
+                if words[i] not in word_list :
+                    word_list[words[i]] = index
+                    index+=1
+
+    return word_list
+
+
+def extract_feature_vectors(infile, word_list, dense=False) :
+    """
+    Produces a bag-of-words representation of a text file specified by the
+    filename infile based on the dictionary word_list.
+    
+    Each line is tokenized once and its words are mapped through word_list,
+    so the cost is linear in the size of the file rather than in the product
+    of the number of lines and the size of the dictionary.
+    
+    Parameters
+    --------------------
+        infile         -- string, filename
+        word_list      -- dictionary, (key, value) pairs are (word, index)
+        dense          -- boolean, return a dense numpy array instead
+    
+    Returns
+    --------------------
+        feature_matrix -- scipy.sparse.csr_matrix of shape (n,d), dtype int8
+                          (numpy array of shape (n,d), dtype uint8, if dense;
+                          see also pack_features)
+                          boolean (0,1) array indicating word presence in a string
+                            n is the number of non-blank lines in the text file
+                            d is the number of unique words in the text file
+    """
+    
+    feature_matrix = stack_feature_blocks(iter_feature_blocks(infile, word_list),
+                                          len(word_list))
+    
+    if dense :
+        return feature_matrix.toarray().astype(np.uint8)
+    return feature_matrix
+
+
+def lines_to_csr(lines, word_list, grow=False, counts=None) :
+    """
+    Converts a list of lines into a block of bag-of-words feature vectors.
+    
+    Parameters
+    --------------------
+        lines     -- list of strings
+        word_list -- dictionary, (key, value) pairs are (word, index)
+        grow      -- boolean, add unseen words to word_list (in order of
+                     first occurrence) instead of ignoring them
+        counts    -- list, counts[j] is incremented for every line that
+                     contains word j, or None
+    
+    Returns
+    --------------------
+        block     -- scipy.sparse.csr_matrix of shape (len(lines), len(word_list)),
+                     dtype int8, boolean (0,1) word presence
+    """
+    
+    indptr = [0]
+    indices = []
+    for words in extract_words_batch(lines) :
+        cols = set()
+        for word in words :
+            j = word_list.get(word)
+            if j is None :
+                if not grow :
+                    continue
+                j = word_list[word] = len(word_list)
+            cols.add(j)
+        if counts is not None :
+            for j in cols :
+                counts[j] += 1
+        indices.extend(sorted(cols))
+        indptr.append(len(indices))
+    
+    indices = np.array(indices, dtype=np.int32)
+    indptr = np.array(indptr, dtype=np.int32)
+    data = np.ones(len(indices), dtype=np.int8)
+    return sparse.csr_matrix((data, indices, indptr),
+                             shape=(len(lines), len(word_list)))
+
+
+def iter_feature_blocks(infile, word_list, chunk_size=10000, grow=False) :
+    """
+    Streams the bag-of-words representation of a text file as sparse row
+    blocks, reading at most chunk_size lines at a time.
+    
+    With grow=True the dictionary is built in the same pass: word_list is
+    extended in place, and each block is as wide as word_list was when the
+    block was emitted (earlier blocks never refer to later words).
+    
+    Parameters
+    --------------------
+        infile     -- string, filename
+        word_list  -- dictionary, (key, value) pairs are (word, index)
+        chunk_size -- int, maximum number of rows per block
+        grow       -- boolean, add unseen words to word_list
+    
+    Returns
+    --------------------
+        blocks     -- generator of scipy.sparse.csr_matrix row blocks
+    """
+    
+    for lines in iter_lines(infile, chunk_size) :
+        yield lines_to_csr(lines, word_list, grow)
+
+
+def iter_labeled_blocks(infile, labelfile, word_list, chunk_size=10000, grow=False) :
+    """
+    Streams feature blocks from infile together with the matching labels
+    from labelfile, reading both files in lockstep.
+    
+    Parameters
+    --------------------
+        infile     -- string, filename of tweets
+        labelfile  -- string, filename of labels (one per line)
+        word_list  -- dictionary, (key, value) pairs are (word, index)
+        chunk_size -- int, maximum number of rows per block
+        grow       -- boolean, add unseen words to word_list
+    
+    Returns
+    --------------------
+        blocks     -- generator of (X_block, y_block) pairs
+    """
+    
+    blocks = iter_feature_blocks(infile, word_list, chunk_size, grow)
+    labels = iter_vector_file(labelfile, chunk_size)
+    for X_block, y_block in izip_longest(blocks, labels) :
+        if X_block is None or y_block is None or X_block.shape[0] != len(y_block) :
+            raise ValueError("%s and %s have different numbers of lines"
+                             % (infile, labelfile))
+        yield X_block, y_block
+
+
+def stack_feature_blocks(blocks, num_words) :
+    """
+    Concatenates sparse row blocks into a single feature matrix, padding
+    narrower blocks out to num_words columns.
+    
+    Parameters
+    --------------------
+        blocks         -- iterable of scipy.sparse.csr_matrix row blocks
+        num_words      -- int, number of columns of the result
+    
+    Returns
+    --------------------
+        feature_matrix -- scipy.sparse.csr_matrix of shape (n, num_words)
+    """
+    
+    data, indices, indptr = [], [], [np.zeros(1, dtype=np.int32)]
+    nnz = 0
+    for block in blocks :
+        data.append(block.data)
+        indices.append(block.indices)
+        indptr.append(block.indptr[1:] + nnz)
+        nnz += block.nnz
+    
+    data = np.concatenate(data) if data else np.zeros(0, dtype=np.int8)
+    indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32)
+    indptr = np.concatenate(indptr)
+    return sparse.csr_matrix((data, indices, indptr),
+                             shape=(len(indptr) - 1, num_words))
+
+
+def extract_dictionary_and_features(infile, chunk_size=10000) :
+    """
+    Builds the dictionary and the bag-of-words feature matrix of a text file
+    in a single streaming pass.
+    
+    Parameters
+    --------------------
+        infile         -- string, filename
+        chunk_size     -- int, number of lines read at a time
+    
+    Returns
+    --------------------
+        word_list      -- dictionary, (key, value) pairs are (word, index)
+        feature_matrix -- scipy.sparse.csr_matrix of shape (n,d)
+    """
+    
+    word_list = {}
+    blocks = list(iter_feature_blocks(infile, word_list, chunk_size, grow=True))
+    return word_list, stack_feature_blocks(blocks, len(word_list))
+
+
+def lines_to_hashed_csr(lines, n_features=2**18, signed=True) :
+    """
+    Converts a list of lines into a block of feature vectors with the
+    hashing trick: each word is mapped to one of n_features columns by its
+    CRC-32 hash, so no dictionary is needed.
+    
+    Parameters
+    --------------------
+        lines      -- list of strings
+        n_features -- int, number of columns (at most 2**31)
+        signed     -- boolean, use the hash's high bit to add +1 or -1, so
+                      colliding words tend to cancel out instead of piling up
+    
+    Returns
+    --------------------
+        block      -- scipy.sparse.csr_matrix of shape (len(lines), n_features),
+                      dtype int32, the (signed) number of distinct words of
+                      each line that hash to each column (int32 rather than
+                      the int8 of lines_to_csr, as with few columns a sum
+                      can exceed 127)
+    """
+    
+    indptr = [0]
+    indices = []
+    data = []
+    for words in extract_words_batch(lines) :
+        cols = {}
+        for word in set(words) :
+            h = crc32(word) & 0xffffffff
+            j = h % n_features
+            cols[j] = cols.get(j, 0) + (-1 if signed and h >> 31 else 1)
+        for j in sorted(cols) :
+            if cols[j] :
+                indices.append(j)
+                data.append(cols[j])
+        indptr.append(len(indices))
+    
+    return sparse.csr_matrix((np.array(data, dtype=np.int32),
+                              np.array(indices, dtype=np.int32),
+                              np.array(indptr, dtype=np.int32)),
+                             shape=(len(lines), n_features))
+
+
+def extract_hashed_feature_vectors(infile, n_features=2**18, signed=True,
+                                   chunk_size=10000) :
+    """
+    Produces a fixed-width, hashed bag-of-words representation of a text
+    file (see lines_to_hashed_csr). Unlike extract_feature_vectors it needs
+    no dictionary, so any file (or part of a file) can be featurized on its
+    own, in constant memory per chunk.
+    
+    Parameters
+    --------------------
+        infile         -- string, filename
+        n_features     -- int, number of columns
+        signed         -- boolean, use signed hashing
+        chunk_size     -- int, number of lines read at a time
+    
+    Returns
+    --------------------
+        feature_matrix -- scipy.sparse.csr_matrix of shape (n, n_features)
+    """
+    
+    blocks = (lines_to_hashed_csr(lines, n_features, signed)
+              for lines in iter_lines(infile, chunk_size))
+    return stack_feature_blocks(blocks, n_features)
+
+
+def pack_features(X, out=None, block_size=10000) :
+    """
+    Packs a word presence matrix into a bitset, eight features per byte.
+    Rows are densified block_size at a time, so the full dense matrix is
+    never held in memory.
+    
+    Parameters
+    --------------------
+        X          -- numpy array or scipy.sparse matrix of shape (n,d)
+        out        -- numpy array (e.g. np.memmap) of shape (n,ceil(d/8)),
+                      dtype uint8, to write to, or None to allocate one
+        block_size -- int, number of rows packed at a time
+    
+    Returns
+    --------------------
+        packed     -- numpy array of shape (n,ceil(d/8)), dtype uint8
+    """
+    
+    n, d = X.shape
+    if out is None :
+        out = np.zeros((n, (d + 7) // 8), dtype=np.uint8)
+    for start in range(0, n, block_size) :
+        block = X[start:start + block_size]
+        block = block.toarray() if sparse.issparse(block) else np.asarray(block)
+        out[start:start + block_size] = np.packbits(block != 0, axis=1)
+    return out
+
+
+def unpack_features(packed, num_words) :
+    """
+    Unpacks (rows of) a bitset made by pack_features into a dense uint8
+    presence matrix of shape (n,num_words).
+    """
+    return np.unpackbits(packed, axis=1)[:, :num_words]
+
+
+def _shard_offsets(infile, n_shards) :
+    """
+    Splits a file into at most n_shards byte ranges that start and end on
+    line boundaries. Returns the list of boundaries, from 0 to the file size.
+    """
+    size = os.path.getsize(infile)
+    offsets = [0]
+    with open(infile, 'rb') as fid :
+        for k in range(1, n_shards) :
+            pos = max(k * size // n_shards, offsets[-1])
+            fid.seek(pos)
+            # move past the first line terminator at or after pos
+            while pos < size :
+                block = fid.read(1 << 16)
+                ends = [i for i in (block.find('\r'), block.find('\n')) if i >= 0]
+                if not ends :
+                    pos += len(block)
+                    continue
+                i = min(ends)
+                pos += i + 1
+                if block[i] == '\r' :
+                    if i + 1 < len(block) :
+                        pos += block[i + 1] == '\n'
+                    else :
+                        pos += fid.read(1) == '\n'
+                break
+            if pos >= size :
+                break
+            offsets.append(pos)
+    offsets.append(size)
+    return offsets
+
+
+def _extract_shard(job) :
+    """
+    Reads the lines of one byte range of a file and featurizes them, with
+    a dictionary local to the shard (or with hashing).
+    """
+    infile, start, end, hashed, n_features, signed = job
+    with open(infile, 'rb') as fid :
+        fid.seek(start)
+        lines = fid.read(end - start).splitlines()
+    if hashed :
+        return None, lines_to_hashed_csr(lines, n_features, signed)
+    word_list = {}
+    block = lines_to_csr(lines, word_list, grow=True)
+    return sorted(word_list, key=word_list.get), block
+
+
+def extract_features_parallel(infile, n_jobs=-1, n_shards=None, hashed=False,
+                              n_features=2**18, signed=True) :
+    """
+    Builds the dictionary and bag-of-words feature matrix of a text file
+    (or its hashed feature matrix) with a pool of worker processes.
+    
+    The file is split into byte ranges on line boundaries. Each worker
+    tokenizes one range and featurizes it against a dictionary of the words
+    in that range. The shard dictionaries are merged in file order, so each
+    word gets the index of its first occurrence in the file, exactly as in
+    extract_dictionary. The shard blocks are then re-indexed and written
+    straight into the arrays of the result.
+    
+    Parameters
+    --------------------
+        infile         -- string, filename
+        n_jobs         -- int, number of worker processes (-1 uses all cores)
+        n_shards       -- int, number of byte ranges (default: 4 per worker)
+        hashed         -- boolean, use lines_to_hashed_csr instead of a dictionary
+        n_features     -- int, number of columns when hashed
+        signed         -- boolean, use signed hashing
+    
+    Returns
+    --------------------
+        word_list      -- dictionary, (key, value) pairs are (word, index)
+                          (None when hashed)
+        feature_matrix -- scipy.sparse.csr_matrix of shape (n,d)
+    """
+    
+    if n_shards is None :
+        n_shards = 4 * _num_workers(n_jobs)
+    offsets = _shard_offsets(infile, n_shards)
+    jobs = [(infile, start, end, hashed, n_features, signed)
+            for start, end in zip(offsets[:-1], offsets[1:])]
+    shards = _map_jobs(_extract_shard, jobs, n_jobs)
+    
+    word_list = None
+    remaps = [None] * len(shards)
+    if not hashed :
+        word_list = {}
+        for k, (words, block) in enumerate(shards) :
+            remaps[k] = np.array([word_list.setdefault(word, len(word_list))
+                                  for word in words], dtype=np.int32)
+        n_features = len(word_list)
+    
+    nnz = sum(block.nnz for _, block in shards)
+    n = sum(block.shape[0] for _, block in shards)
+    data = np.empty(nnz, dtype=np.int32 if hashed else np.int8)
+    indices = np.empty(nnz, dtype=np.int32)
+    indptr = np.empty(n + 1, dtype=np.int32)
+    indptr[0] = 0
+    row = pos = 0
+    for remap, (_, block) in zip(remaps, shards) :
+        rows, k = block.shape[0], block.nnz
+        data[pos:pos + k] = block.data
+        indices[pos:pos + k] = block.indices if remap is None else remap[block.indices]
+        indptr[row + 1:row + rows + 1] = block.indptr[1:] + pos
+        row += rows
+        pos += k
+    
+    feature_matrix = sparse.csr_matrix((data, indices, indptr), shape=(n, n_features))
+    # re-indexing can reorder the columns within a row
+    feature_matrix.sort_indices()
+    return word_list, feature_matrix
+
+
+def test_extract_dictionary(dictionary) :
+    err = "extract_dictionary implementation incorrect"
+    
+    assert len(dictionary) == 1811, err
+    
+    exp = [('2012', 0),
+           ('carol', 10),
+           ('ve', 20),
+           ('scary', 30),
+           ('vacation', 40),
+           ('just', 50),
+           ('excited', 60),
+           ('no', 70),
+           ('cinema', 80),
+           ('frm', 90)]
+    act = [sorted(dictionary.items(), key=lambda it: it[1])[i] for i in range(0,100,10)]
+    assert exp == act, err
+
+
+def test_extract_feature_vectors(X) :
+    err = "extract_features_vectors implementation incorrect"
+    
+    assert X.shape == (630, 1811), err
+    
+    exp = np.array([[ 1.,  1.,  1.,  1.,  1.,  1.,  1.,  1.,  1.,  1.],
+                    [ 1.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  1.],
+                    [ 0.,  1.,  0.,  0.,  0.,  0.,  0.,  0.,  1.,  1.],
+                    [ 0.,  0.,  0.,  0.,  0.,  1.,  0.,  0.,  1.,  1.],
+                    [ 0.,  1.,  0.,  0.,  0.,  1.,  0.,  0.,  1.,  1.],
+                    [ 0.,  0.,  0.,  1.,  0.,  0.,  0.,  0.,  1.,  1.],
+                    [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  1.,  1.],
+                    [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  1.,  1.],
+                    [ 0.,  1.,  0.,  0.,  1.,  0.,  0.,  0.,  1.,  1.],
+                    [ 0.,  1.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  1.]])
+    act = X[:10,:10]
+    if sparse.issparse(act) :
+        act = act.toarray()
+    assert (exp == act).all(), err
+
+
+######################################################################
+# classes -- vocabulary
+######################################################################
+
+class Vocabulary(object) :
+    """
+    Bidirectional mapping between words and feature indices.
+    
+    Words are kept in a list in index order (index -> word), with a dict
+    as the hash index (word -> index), so lookups in both directions are
+    O(1). For each word, the vocabulary also counts the number of lines
+    added through update that contain it. A Vocabulary can be used wherever
+    a word_list dictionary is expected.
+    
+    A frozen vocabulary does not add new words: update only counts words
+    that are already known, and encode ignores unknown words in any case.
+    """
+    
+    def __init__(self, words=()) :
+        """
+        Parameters
+        --------------------
+            words -- iterable of strings, initial words in index order
+        """
+        self._words = []
+        self._index = {}
+        self._counts = []
+        self._word_array = None
+        self.frozen = False
+        for word in words :
+            self.add(word)
+    
+    @classmethod
+    def from_file(cls, infile, chunk_size=10000) :
+        """Builds a vocabulary (with counts) from the lines of a text file."""
+        vocab = cls()
+        for lines in iter_lines(infile, chunk_size) :
+            vocab.update(lines)
+        return vocab
+    
+    def add(self, word) :
+        """
+        Returns the index of word, adding it to the vocabulary if needed
+        (None if it is unknown and the vocabulary is frozen).
+        """
+        j = self._index.get(word)
+        if j is None and not self.frozen :
+            j = self._index[word] = len(self._words)
+            self._words.append(word)
+            self._counts.append(0)
+            self._word_array = None
+        return j
+    
+    def update(self, lines) :
+        """Adds the words of a list of lines, counting the lines each word occurs in."""
+        counts = self._counts
+        for words in extract_words_batch(lines) :
+            for j in set(self.add(word) for word in words) :
+                if j is not None :
+                    counts[j] += 1
+        return self
+    
+    def freeze(self) :
+        """Stops the vocabulary from growing; returns self."""
+        self.frozen = True
+        return self
+    
+    def encode(self, lines, grow=False) :
+        """
+        Returns the bag-of-words feature vectors of a list of lines (see
+        lines_to_csr). With grow=True, the words of the lines are also
+        added and counted as by update, with each line tokenized only once;
+        the result is then as wide as the grown vocabulary.
+        """
+        if not grow :
+            return lines_to_csr(lines, self)
+        return lines_to_csr(lines, self, not self.frozen, self._counts)
+    
+    def word(self, index) :
+        """Returns the word with the given index."""
+        return self._words[index]
+    
+    def decode(self, indices) :
+        """Returns the words with the given indices, as a numpy array of strings."""
+        if self._word_array is None :
+            self._word_array = np.array(self._words, dtype=object)
+        return self._word_array[np.asarray(indices, dtype=np.intp)]
+    
+    @property
+    def counts(self) :
+        """numpy array of shape (d,), number of lines containing each word."""
+        return np.array(self._counts, dtype=np.int64)
+    
+    def prune(self, min_freq=1, max_size=None) :
+        """
+        Returns a new vocabulary without the words that occur in fewer than
+        min_freq lines, and with only the max_size most frequent words if
+        max_size is given (ties broken by index). The surviving words keep
+        their relative order.
+        
+        Parameters
+        --------------------
+            min_freq -- int, minimum number of lines containing a word
+            max_size -- int, maximum number of words, or None
+        
+        Returns
+        --------------------
+            vocab    -- Vocabulary, the pruned vocabulary (with counts)
+            kept     -- numpy array of shape (len(vocab),), old index of each
+                        word; X[:, kept] re-indexes a feature matrix
+        """
+        counts = self.counts
+        kept = np.flatnonzero(counts >= min_freq)
+        if max_size is not None and len(kept) > max_size :
+            # stable sort by decreasing count keeps the lower index on ties
+            order = np.argsort(-counts[kept], kind='mergesort')[:max_size]
+            kept = np.sort(kept[order])
+        
+        vocab = Vocabulary(self._words[j] for j in kept)
+        vocab._counts = counts[kept].tolist()
+        vocab.frozen = self.frozen
+        return vocab, kept
+    
+    # dictionary interface, (key, value) pairs are (word, index)
+    
+    def __len__(self) :
+        return len(self._words)
+    
+    def __setitem__(self, word, index) :
+        # only appending is supported, as by lines_to_csr(grow=True)
+        if self.frozen or word in self._index or index != len(self._words) :
+            raise ValueError("can only append a new word at index %d" % len(self._words))
+        self.add(word)
+    
+    def __contains__(self, word) :
+        return word in self._index
+    
+    def __getitem__(self, word) :
+        return self._index[word]
+    
+    def __iter__(self) :
+        return iter(self._words)
+    
+    def get(self, word, default=None) :
+        return self._index.get(word, default)
+    
+    def keys(self) :
+        return list(self._words)
+    
+    def values(self) :
+        return range(len(self._words))
+    
+    def items(self) :
+        return zip(self._words, range(len(self._words)))
+
+
+######################################################################
+# classes -- feature store
+######################################################################
+
+class FeatureStore(object) :
+    """
+    On-disk cache of dictionaries and feature matrices.
+    
+    An entry is keyed by a hash of the input file's contents, the tokenizer
+    and (when featurizing against an existing dictionary) the dictionary
+    itself. It is a directory holding the vocabulary in index order (packed
+    by pack_tokens) and the CSR arrays of the feature matrix as .npy files.
+    With mmap=True, a hit memory-maps the arrays read-only instead of
+    reading them, so a feature matrix larger than RAM is paged in only as
+    rows are sliced from it. An entry goes stale when the file or tokenizer
+    changes: its key no longer matches, and it is deleted when the entry for
+    the file's new contents is written. The store is kept under max_bytes by
+    evicting the least recently used entries first.
+    """
+    
+    def __init__(self, cache_dir, max_bytes=2**30, mmap=False) :
+        """
+        Parameters
+        --------------------
+            cache_dir -- string, directory holding the cache entries
+            max_bytes -- int, maximum total size of the cache entries
+            mmap      -- boolean, memory-map the feature matrices of hits
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        if not os.path.isdir(cache_dir) :
+            os.makedirs(cache_dir)
+    
+    def load(self, infile, word_list=None) :
+        """
+        Returns the dictionary and feature matrix of infile, from the cache
+        if possible, otherwise by extracting them and storing the result.
+        
+        Parameters
+        --------------------
+            infile         -- string, filename
+            word_list      -- dictionary, (key, value) pairs are (word, index),
+                              or None to build the dictionary from infile
+        
+        Returns
+        --------------------
+            word_list      -- dictionary, (key, value) pairs are (word, index)
+            feature_matrix -- scipy.sparse.csr_matrix of shape (n,d), whose
+                              arrays are read-only memory maps if mmap
+        """
+        
+        prefix, key = self._key(infile, word_list)
+        path = os.path.join(self.cache_dir, '%s-%s' % (prefix, key))
+        if os.path.isdir(path) :
+            PROFILER.count('feature_store/hits')
+            os.utime(path, None)
+            mmap_mode = 'r' if self.mmap else None
+            load = lambda name : np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+            tokens = unpack_tokens(load('token_bytes'), load('token_offsets'))
+            X = sparse.csr_matrix((load('data'), load('indices'), load('indptr')),
+                                  shape=tuple(load('shape')), copy=False)
+            if word_list is None :
+                word_list = dict(zip(tokens, range(len(tokens))))
+            return word_list, X
+        
+        PROFILER.count('feature_store/misses')
+        if word_list is None :
+            word_list, X = extract_dictionary_and_features(infile)
+        else :
+            X = extract_feature_vectors(infile, word_list)
+        self._store(path, prefix, word_list, X)
+        return word_list, X
+    
+    @staticmethod
+    def _key(infile, word_list) :
+        """
+        Returns the prefix shared by all entries for infile, and the key of
+        the entry for its current contents.
+        """
+        prefix = hashlib.sha1(os.path.abspath(infile)).hexdigest()[:12]
+        digest = hashlib.sha1(_WORD_RE.pattern)
+        if word_list is not None :
+            prefix += 'w'
+            for word in sorted(word_list, key=word_list.get) :
+                digest.update(word + '\0')
+        with open(infile, 'rb') as fid :
+            for block in iter(lambda: fid.read(1 << 20), '') :
+                digest.update(block)
+        return prefix, digest.hexdigest()
+    
+    def _store(self, path, prefix, word_list, X) :
+        # entries for older contents of the same file can never be hit again
+        for name in os.listdir(self.cache_dir) :
+            if name.startswith(prefix + '-') :
+                shutil.rmtree(os.path.join(self.cache_dir, name))
+        
+        tokens = sorted(word_list, key=word_list.get)
+        # the entry is written under a temporary name and renamed when
+        # complete, so a crash never leaves a partial entry behind its key
+        tmp = tempfile.mkdtemp(prefix='tmp-', dir=self.cache_dir)
+        token_bytes, token_offsets = pack_tokens(tokens)
+        arrays = {'token_bytes': token_bytes, 'token_offsets': token_offsets, 'data': X.data,
+                  'indices': X.indices, 'indptr': X.indptr, 'shape': np.array(X.shape)}
+        for name, array in arrays.items() :
+            np.save(os.path.join(tmp, name + '.npy'), array)
+        os.rename(tmp, path)
+        self._evict()
+    
+    @staticmethod
+    def _size(path) :
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    
+    def _evict(self) :
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                 if not name.startswith('tmp')]
+        paths = [path for path in paths if os.path.isdir(path)]
+        paths.sort(key=os.path.getmtime)
+        total = sum(self._size(path) for path in paths)
+        # the newest entry is always kept, even if it alone exceeds the budget
+        for path in paths[:-1] :
+            if total <= self.max_bytes :
+                break
+            total -= self._size(path)
+            shutil.rmtree(path)
+
+
+######################################################################
+# classes -- kernel cache
+######################################################################
+
+class KernelCache(object) :
+    """
+    Kernel matrices of one dataset, for training SVCs with
+    kernel='precomputed'.
+    
+    The Gram matrix and the squared-distance matrix are computed once. The
+    linear kernel is the Gram matrix itself, and an RBF kernel is derived
+    from the distances for each gamma. RBF kernels are kept in
+    least-recently-used order and evicted once they exceed max_bytes.
+    preload computes kernels ahead of time, so that worker processes forked
+    afterwards share them instead of each computing and caching its own. With
+    mmap_dir, the Gram and distance matrices are memory-mapped from
+    (anonymous) files in that directory instead of being held in RAM.
+    """
+    
+    def __init__(self, X, max_bytes=2**30, mmap_dir=None, block_size=1024) :
+        """
+        Parameters
+        --------------------
+            X          -- numpy array or scipy.sparse matrix of shape (n,d)
+            max_bytes  -- int, memory budget for cached RBF kernels
+            mmap_dir   -- string, directory for memory-mapped matrices, or None
+            block_size -- int, number of rows computed at a time
+        """
+        n = X.shape[0]
+        self.max_bytes = max_bytes
+        self.gram = self._allocate((n, n), mmap_dir)
+        self.sq_dist = self._allocate((n, n), mmap_dir)
+        self._kernels = OrderedDict()
+        
+        for start in range(0, n, block_size) :
+            # promote to float so that the int8 feature counts cannot overflow
+            block = X[start:start + block_size].astype(np.float64).dot(X.T)
+            self.gram[start:start + block_size] = block.toarray() if sparse.issparse(block) else block
+        sq_norms = np.diag(self.gram).copy()
+        for start in range(0, n, block_size) :
+            rows = slice(start, start + block_size)
+            dist = sq_norms[rows, np.newaxis] + sq_norms[np.newaxis, :] - 2 * self.gram[rows]
+            self.sq_dist[rows] = np.maximum(dist, 0)
+    
+    @staticmethod
+    def _allocate(shape, mmap_dir) :
+        if mmap_dir is None :
+            return np.zeros(shape)
+        return np.memmap(tempfile.TemporaryFile(dir=mmap_dir), dtype=np.float64,
+                         mode='w+', shape=shape)
+    
+    @staticmethod
+    def kernel_key(params) :
+        """Returns the part of a set of SVC parameters that determines the kernel."""
+        kernel = params.get('kernel', 'rbf')
+        if kernel == 'linear' :
+            return ('linear',)
+        if kernel == 'rbf' :
+            return ('rbf', params['gamma'])
+        raise ValueError("KernelCache supports 'linear' and 'rbf' kernels, not %r" % kernel)
+    
+    @staticmethod
+    def svc_params(params) :
+        """Converts SVC parameters to the equivalent ones for a precomputed kernel."""
+        params = dict((k, v) for k, v in params.items() if k not in ('kernel', 'gamma'))
+        params['kernel'] = 'precomputed'
+        return params
+    
+    def kernel(self, params, keep=True) :
+        """
+        Returns the (n,n) kernel matrix for a set of SVC parameters. A kernel
+        that is not cached yet is added to the cache only if keep.
+        """
+        key = self.kernel_key(params)
+        if key[0] == 'linear' :
+            return self.gram
+        
+        if key in self._kernels :
+            PROFILER.count('kernel_cache/hits')
+            K = self._kernels.pop(key)
+        else :
+            PROFILER.count('kernel_cache/misses')
+            K = np.exp(-key[1] * self.sq_dist)
+            if not keep :
+                return K
+            while self._kernels and self.nbytes() + K.nbytes > self.max_bytes :
+                self._kernels.popitem(last=False)
+        self._kernels[key] = K
+        return K
+    
+    def preload(self, param_list) :
+        """
+        Computes the kernels of the given settings, in order, for as long as
+        they fit in max_bytes without evicting any cached kernel.
+        """
+        for params in param_list :
+            key = self.kernel_key(params)
+            if key[0] == 'linear' or key in self._kernels :
+                continue
+            if self.nbytes() + self.sq_dist.nbytes > self.max_bytes :
+                break
+            self.kernel(params)
+    
+    def nbytes(self) :
+        """Returns the memory held by cached RBF kernels."""
+        return sum(K.nbytes for K in self._kernels.values())
+
+
+######################################################################
+# classes -- fold plan
+######################################################################
+
+class FoldPlan(object) :
+    """
+    Cross-validation folds of one dataset, split once and reused.
+    
+    The folds' index arrays are computed once from a KFold or
+    StratifiedKFold. With materialize=True, the train and test blocks of X
+    and y are also sliced once, so a grid search does not copy X again for
+    every (setting, fold) fit. Grid search workers are forked after the
+    plan is created, so they read the same blocks through copy-on-write
+    shared memory instead of receiving copies.
+    
+    With index, the folds are drawn from the rows index of X only (e.g. the
+    training rows of a shuffled split), and each fold's blocks are sliced
+    from X directly. X can then be a memory-mapped matrix (see
+    FeatureStore) that is never copied as a whole. Split indices are
+    positions within index.
+    
+    A FoldPlan can be passed wherever a KFold is expected, provided it was
+    built for the same examples: X and y, or X[index] and y[index].
+    """
+    
+    def __init__(self, X, y, kf, materialize=True, index=None) :
+        """
+        Parameters
+        --------------------
+            X           -- numpy array or scipy.sparse matrix of shape (n,d)
+            y           -- numpy array of shape (n,), binary labels {1,-1}
+            kf          -- model_selection.KFold or model_selection.StratifiedKFold
+            materialize -- boolean, slice and keep the blocks of every fold
+                           (k times the memory of X) instead of slicing them
+                           on every request
+            index       -- numpy array of shape (m,), rows of X to split,
+                           or None for all rows
+        """
+        self.X = X
+        self.index = None if index is None else np.asarray(index)
+        if self.index is None :
+            self.y = y
+            splits = kf.split(X, y)
+        else :
+            self.y = y[self.index]
+            splits = kf.split(np.zeros(len(self.index)), self.y)
+        self.splits = [(np.asarray(train), np.asarray(test)) for train, test in splits]
+        self._blocks = None
+        if materialize :
+            self._blocks = [self._slice(train, test) for train, test in self.splits]
+    
+    def _slice(self, train, test) :
+        if self.index is None :
+            rows_train, rows_test = train, test
+        else :
+            rows_train, rows_test = self.index[train], self.index[test]
+        return self.X[rows_train], self.y[train], self.X[rows_test], self.y[test]
+    
+    def __len__(self) :
+        return len(self.splits)
+    
+    def get_n_splits(self, X=None, y=None, groups=None) :
+        return len(self.splits)
+    
+    def split(self, X=None, y=None, groups=None) :
+        """Yields the (train, test) index arrays of every fold."""
+        return iter(self.splits)
+    
+    def fold(self, i) :
+        """Returns X_train, y_train, X_test, y_test of fold i."""
+        if self._blocks is not None :
+            return self._blocks[i]
+        return self._slice(*self.splits[i])
+
+
+def _fold_plan(X, y, kf) :
+    """Returns kf if it is already a FoldPlan, otherwise a new one for X and y."""
+    if isinstance(kf, FoldPlan) :
+        return kf
+    return FoldPlan(X, y, kf)
+
+
+def shuffle_indices(n, random_state=0) :
+    """
+    Returns a random order of n rows. Slicing X and y by it gives the same
+    result as sklearn.utils.shuffle(X, y, random_state=random_state), but
+    the order can be sliced into a training and test split first, so that
+    only the rows of each split are copied.
+    """
+    indices = np.arange(n)
+    np.random.RandomState(random_state).shuffle(indices)
+    return indices
+
+
+######################################################################
+# classes -- checkpoint
+######################################################################
+
+class Checkpoint(object) :
+    """
+    Append-only log of the scores of completed cross-validation jobs, one
+    JSON record per line.
+    
+    A record holds the scores of one setting (a dictionary of SVC
+    parameters) on one fold for every metric that was scored, and the
+    fingerprint of the fold plan it was scored on. Records are appended as
+    soon as a job finishes, so an interrupted run loses at most the jobs
+    that were running. A restarted run with the same checkpoint skips every
+    (setting, fold) pair that already has a record for the same data and
+    folds. A truncated last line (from a run killed mid-write) is ignored.
+    
+    The file can be read while a run is still appending to it, e.g. by
+    table or by `python twitter.py progress FILE`.
+    """
+    
+    def __init__(self, path) :
+        """
+        Parameters
+        --------------------
+            path -- string, filename of the log (created on first append)
+        """
+        self.path = path
+        self.records = []
+        self._scores = {}
+        self._terminate = False
+        if os.path.exists(path) :
+            with open(path) as fid :
+                for line in fid :
+                    # a truncated last line is ended before the next record
+                    self._terminate = not line.endswith('\n')
+                    try :
+                        record = json.loads(line)
+                    except ValueError :
+                        continue
+                    self.records.append(record)
+                    self._scores[self._key(record['plan'], record['params'],
+                                           record['fold'])] = record['scores']
+    
+    @staticmethod
+    def _key(plan_id, params, fold) :
+        return json.dumps([plan_id, params, fold], sort_keys=True)
+    
+    @staticmethod
+    def fingerprint(plan) :
+        """Returns a digest of the examples, labels and folds of a FoldPlan."""
+        if getattr(plan, '_fingerprint', None) is None :
+            X = plan.X
+            digest = hashlib.sha1(str(X.shape))
+            arrays = [X.data, X.indices, X.indptr] if sparse.issparse(X) else [X]
+            arrays += [plan.y] + [rows for split in plan.splits for rows in split]
+            if plan.index is not None :
+                arrays.append(plan.index)
+            for array in arrays :
+                digest.update(np.ascontiguousarray(array))
+            plan._fingerprint = digest.hexdigest()
+        return plan._fingerprint
+    
+    def get(self, plan_id, params, fold, metric_names) :
+        """
+        Returns the scores of a setting on a fold as a numpy array of shape
+        (len(metric_names),), or None if they have not all been recorded.
+        """
+        scores = self._scores.get(self._key(plan_id, params, fold))
+        if scores is None or any(m not in scores for m in metric_names) :
+            return None
+        return np.array([scores[m] for m in metric_names])
+    
+    def append(self, plan_id, params, fold, metric_names, scores) :
+        """Records the scores of a setting on a fold."""
+        record = OrderedDict([('plan', plan_id), ('params', params), ('fold', fold),
+                              ('scores', OrderedDict(zip(metric_names, map(float, scores)))),
+                              ('time', time.time())])
+        # one write of a whole line per record, so concurrent readers only
+        # ever see complete records (or a partial last line)
+        with open(self.path, 'a') as fid :
+            fid.write(('\n' if self._terminate else '') + json.dumps(record) + '\n')
+        self._terminate = False
+        self.records.append(record)
+        self._scores[self._key(plan_id, params, fold)] = record['scores']
+    
+    def table(self, metric_names=None) :
+        """
+        Returns the average scores recorded so far for every setting, in
+        order of first record.
+        
+        Parameters
+        --------------------
+            metric_names -- list of strings, metrics to average (default: METRICS)
+        
+        Returns
+        --------------------
+            rows         -- list of (params, n_folds, scores) tuples, where
+                            scores is a numpy array of shape
+                            (len(metric_names),), the average over the
+                            n_folds folds recorded for params (nan for
+                            metrics that were not recorded)
+        """
+        if metric_names is None :
+            metric_names = METRICS
+        folds = OrderedDict()
+        for record in self.records :
+            key = json.dumps([record['plan'], record['params']], sort_keys=True)
+            folds.setdefault(key, (record['params'], {}))[1][record['fold']] = record['scores']
+        
+        rows = []
+        for params, scores in folds.values() :
+            fold_scores = [[s.get(m, np.nan) for s in scores.values()] for m in metric_names]
+            rows.append((params, len(scores), _average_scores(fold_scores)))
+        return rows
+
+
+######################################################################
+# functions -- evaluation
+######################################################################
+
+METRICS = ["accuracy", "f1_score", "auroc", "precision", "sensitivity", "specificity"]
+
+def _scores_from_counts(tp, fp, fn, tn, metric) :
+    """
+    Computes a label-based performance metric from (arrays of) confusion
+    counts. Ratios with a zero denominator score 0, as in sklearn.
+    """
+    tp, fp, fn, tn = [np.asarray(c, dtype=float) for c in (tp, fp, fn, tn)]
+    if metric == "accuracy":
+        num, den = tp + tn, tp + fp + fn + tn
+    elif metric == "f1_score":
+        num, den = 2 * tp, 2 * tp + fp + fn
+    elif metric == "precision":
+        num, den = tp, tp + fp
+    elif metric == "sensitivity":
+        num, den = tp, tp + fn
+    elif metric == "specificity":
+        num, den = tn, tn + fp
+    else:
+        raise ValueError("Input has wrong metric")
+    with np.errstate(divide='ignore', invalid='ignore') :
+        return np.where(den > 0, num / den, 0.)
+
+
+def _auroc(pos, y_pred) :
+    """
+    Computes the AUROC of each row of y_pred from the Mann-Whitney rank
+    statistic, with tied scores given their average rank (rows with a single
+    class score nan).
+    """
+    m, n = y_pred.shape
+    rows = np.arange(m)[:, np.newaxis]
+    order = np.argsort(y_pred, axis=1, kind='mergesort')
+    sorted_pred = y_pred[rows, order]
+    sorted_pos = pos[rows, order]
+    
+    # number the runs of tied scores consecutively across all rows, then give
+    # every member of a run the mean of the (1-based) ranks it spans
+    starts = np.ones((m, n), dtype=bool)
+    starts[:, 1:] = sorted_pred[:, 1:] != sorted_pred[:, :-1]
+    runs = np.cumsum(starts.ravel()) - 1
+    ranks = np.tile(np.arange(1, n + 1, dtype=float), m)
+    mean_ranks = np.bincount(runs, weights=ranks) / np.bincount(runs)
+    rank_sum = (mean_ranks[runs].reshape(m, n) * sorted_pos).sum(axis=1)
+    
+    num_pos = sorted_pos.sum(axis=1).astype(float)
+    num_neg = n - num_pos
+    with np.errstate(divide='ignore', invalid='ignore') :
+        return (rank_sum - num_pos * (num_pos + 1) / 2) / (num_pos * num_neg)
+
+
+def performance_all(y_true, y_pred, metrics=METRICS) :
+    """
+    Calculates several performance metrics at once. The predictions are
+    thresholded and the confusion counts tallied a single time, and every
+    label-based metric is derived from those counts.
+    
+    Parameters
+    --------------------
+        y_true  -- numpy array of shape (n,) or (m,n), known labels {1,-1}
+        y_pred  -- numpy array of shape (n,) or (m,n), (continuous-valued)
+                   predictions, e.g. one row per model or per bootstrap resample
+        metrics -- list of strings, options from METRICS
+    
+    Returns
+    --------------------
+        scores  -- numpy array of shape (len(metrics),), or (len(metrics),m)
+                   for 2-D input; undefined ratios score 0 and undefined
+                   AUROC (a single class) scores nan
+    """
+    
+    y_pred = np.asarray(y_pred, dtype=float)
+    one_d = y_pred.ndim == 1
+    y_pred = np.atleast_2d(y_pred)
+    pos = np.broadcast_to(np.atleast_2d(np.asarray(y_true) == 1), y_pred.shape)
+    
+    # map points of hyperplane to +1
+    pred_pos = y_pred >= 0
+    tp = (pos & pred_pos).sum(axis=1)
+    fn = pos.sum(axis=1) - tp
+    fp = pred_pos.sum(axis=1) - tp
+    tn = y_pred.shape[1] - tp - fn - fp
+    
+    scores = np.zeros((len(metrics), y_pred.shape[0]))
+    for i, metric in enumerate(metrics) :
+        if metric == "auroc" :
+            scores[i] = _auroc(pos, y_pred)
+        else :
+            scores[i] = _scores_from_counts(tp, fp, fn, tn, metric)
+    
+    if one_d :
+        return scores[:, 0]
+    return scores
+
+
+def performance(y_true, y_pred, metric="accuracy") :
+    """
+    Calculates the performance metric based on the agreement between the 
+    true labels and the predicted labels.
+    
+    Parameters
+    --------------------
+        y_true -- numpy array of shape (n,), known labels
+        y_pred -- numpy array of shape (n,), (continuous-valued) predictions
+        metric -- string, option used to select the performance measure
+                  options: 'accuracy', 'f1_score', 'auroc', 'precision',
+                           'sensitivity', 'specificity'        
+    
+    Returns
+    --------------------
+        score  -- float, performance score
+    """
+    
+    # part 2a: compute classifier performance
+    if metric not in METRICS :
+        return "Input has wrong metric"
+    return performance_all(y_true, y_pred, [metric])[0]
+
+
+def test_performance() :
+    # np.random.seed(1234)
+    # y_true = 2 * np.random.randint(0,2,10) - 1
+    # np.random.seed(2345)
+    # y_pred = (10 + 10) * np.random.random(10) - 10
+    
+    y_true = [ 1,  1, -1,  1, -1, -1, -1,  1,  1,  1]
+    #y_pred = [ 1, -1,  1, -1,  1,  1, -1, -1,  1, -1]
+    # confusion matrix
+    #          pred pos     neg
+    # true pos      tp (2)  fn (4)
+    #      neg      fp (3)  tn (1)
+    y_pred = [ 3.21288618, -1.72798696,  3.36205116, -5.40113156,  6.15356672,
+               2.73636929, -6.55612296, -4.79228264,  8.30639981, -0.74368981]
+    metrics = ["accuracy", "f1_score", "auroc", "precision", "sensitivity", "specificity"]
+    scores  = [     3/10.,      4/11.,  5/12.,       2/5.,          2/6.,          1/4.]
+    
+    import sys
+    eps = sys.float_info.epsilon
+    
+    for i, metric in enumerate(metrics) :
+        assert abs(performance(y_true, y_pred, metric) - scores[i]) < eps, \
+            (metric, performance(y_true, y_pred, metric), scores[i])
+
+
+def _metric_list(metric) :
+    """Normalizes a metric name or a list of metric names to a list."""
+    if isinstance(metric, basestring) :
+        return [metric]
+    return list(metric)
+
+
+def _average_scores(fold_scores) :
+    """Averages fold scores along the last axis, skipping undefined (nan) folds."""
+    fold_scores = np.asarray(fold_scores, dtype=float)
+    valid = ~np.isnan(fold_scores)
+    return np.where(valid, fold_scores, 0).sum(axis=-1) / valid.sum(axis=-1)
+
+
+def cv_performance(clf, X, y, kf, metric="accuracy") :
+    """
+    Splits the data, X and y, into k-folds and runs k-fold cross-validation.
+    Trains classifier on k-1 folds and tests on the remaining fold.
+    Calculates the k-fold cross-validation performance metric for classifier
+    by averaging the performance across folds.
+    
+    The classifier is fit once per fold; when several metrics are requested
+    they are all computed from the same decision function output.
+    
+    Parameters
+    --------------------
+        clf    -- classifier (instance of SVC)
+        X      -- numpy array of shape (n,d), feature vectors
+                    n = number of examples
+                    d = number of features
+        y      -- numpy array of shape (n,), binary labels {1,-1}
+        kf     -- model_selection.KFold, model_selection.StratifiedKFold
+                  or FoldPlan
+        metric -- string or list of strings, option(s) used to select
+                  performance measure
+    
+    Returns
+    --------------------
+        score   -- float, average cross-validation performance across k folds
+                   (numpy array of shape (len(metric),) for a list of metrics)
+    """
+    
+    metric_names = _metric_list(metric)
+    plan = _fold_plan(X, y, kf)
+    scores = []
+    for i in range(len(plan)) :
+        X_train, y_train, X_test, y_test = plan.fold(i)
+        with PROFILER.timer('cv/fit') :
+            clf.fit(X_train, y_train)
+        PROFILER.count('cv/fits')
+        # use SVC.decision_function to make ``continuous-valued'' predictions
+        with PROFILER.timer('cv/decision') :
+            y_pred = clf.decision_function(X_test)
+        with PROFILER.timer('cv/metrics') :
+            scores.append(performance_all(y_test, y_pred, metric_names))
+    
+    score = _average_scores(np.transpose(scores))
+    if isinstance(metric, basestring) :
+        return score[0]
+    return score
+
+
+# training data shared with grid search workers; it is set before the pool
+# is forked, so workers inherit it instead of receiving a pickled copy per job
+_GRID_STATE = {}
+
+def _cv_fold_score(job) :
+    """
+    Fits an SVC for each of the given (setting, fold) pairs and scores them.
+    With a kernel cache, the pairs share one kernel, which is looked up once
+    and sliced once per fold.
+    """
+    from sklearn.svm import SVC
+    
+    plan = _GRID_STATE['plan']
+    param_grid, cache = _GRID_STATE['param_grid'], _GRID_STATE['kernel_cache']
+    if cache is not None :
+        with PROFILER.timer('cv/kernel') :
+            K = cache.kernel(param_grid[job[0][0]], _GRID_STATE['keep_kernels'])
+    
+    results = []
+    current = None
+    for i, fold in job :
+        if fold != current :
+            current = fold
+            if cache is None :
+                X_train, y_train, X_test, y_test = plan.fold(fold)
+            else :
+                train, test = plan.splits[fold]
+                with PROFILER.timer('cv/kernel') :
+                    X_train, X_test = K[np.ix_(train, train)], K[np.ix_(test, train)]
+                y_train, y_test = plan.y[train], plan.y[test]
+        
+        params = param_grid[i]
+        if cache is not None :
+            params = KernelCache.svc_params(params)
+        clf = SVC(**params)
+        with PROFILER.timer('cv/fit') :
+            clf.fit(X_train, y_train)
+        PROFILER.count('cv/fits')
+        with PROFILER.timer('cv/decision') :
+            y_pred = clf.decision_function(X_test)
+        with PROFILER.timer('cv/metrics') :
+            results.append(performance_all(y_test, y_pred, _GRID_STATE['metrics']))
+    return results
+
+
+def _num_workers(n_jobs) :
+    """Maps an sklearn-style n_jobs value to a number of processes."""
+    if n_jobs is None :
+        return 1
+    if n_jobs < 0 :
+        return max(cpu_count() + 1 + n_jobs, 1)
+    return n_jobs
+
+
+def _pool_job(task) :
+    """
+    Runs func on the i-th job in a worker process. Returns i with the
+    result and, while profiling, the timers and counters recorded while it
+    ran.
+    """
+    func, i, job = task
+    if not PROFILER.enabled :
+        return i, func(job), None, None
+    PROFILER.reset()
+    result = func(job)
+    return i, result, PROFILER.timers, PROFILER.counters
+
+
+def _map_jobs(func, jobs, n_jobs, callback=None, **state) :
+    """
+    Applies func to every job, in a pool of n_jobs worker processes if
+    n_jobs != 1, with state made available to func through _GRID_STATE.
+    Results are returned in job order. callback(i, result) is called in
+    this process as soon as the i-th job finishes, in order of completion.
+    While profiling, the workers' timers and counters are merged into
+    PROFILER.
+    """
+    _GRID_STATE.update(state)
+    try :
+        # no more workers than jobs (e.g. when a checkpoint leaves few jobs)
+        workers = min(_num_workers(n_jobs), max(len(jobs), 1))
+        if workers == 1 :
+            results = []
+            for i, job in enumerate(jobs) :
+                results.append(func(job))
+                if callback is not None :
+                    callback(i, results[-1])
+            return results
+        pool = Pool(workers)
+        try :
+            chunksize = max(len(jobs) // (4 * workers), 1)
+            tasks = [(func, i, job) for i, job in enumerate(jobs)]
+            results = [None] * len(jobs)
+            # results are received as soon as each chunk of jobs finishes,
+            # whichever worker it ran on, and put back in job order
+            for i, result, timers, counters in pool.imap_unordered(_pool_job, tasks,
+                                                                   chunksize=chunksize) :
+                if timers is not None :
+                    PROFILER.merge(timers, counters)
+                results[i] = result
+                if callback is not None :
+                    callback(i, result)
+            return results
+        finally :
+            pool.close()
+            pool.join()
+    finally :
+        _GRID_STATE.clear()
+
+
+def _grid_fold_scores(param_grid, plan, metric_names, pairs, n_jobs=1,
+                      kernel_cache=None, checkpoint=None) :
+    """
+    Scores the given (setting, fold) pairs of a grid search. With a kernel
+    cache, the pairs whose settings share a kernel are grouped into one job,
+    so each kernel is computed once. Before a pool is forked, the parent
+    preloads the kernels that fit in the cache, and the workers share them
+    rather than each holding their own. With a checkpoint, pairs it already
+    holds are not scored again, and the scores of every finished job are
+    appended to it. Returns a dictionary mapping each pair to its array of
+    scores.
+    """
+    fold_scores = {}
+    if checkpoint is not None :
+        plan_id = Checkpoint.fingerprint(plan)
+        for i, fold in pairs :
+            scores = checkpoint.get(plan_id, param_grid[i], fold, metric_names)
+            if scores is not None :
+                fold_scores[i, fold] = scores
+        pairs = [pair for pair in pairs if pair not in fold_scores]
+    
+    keep_kernels = True
+    if kernel_cache is None :
+        jobs = [[pair] for pair in pairs]
+    else :
+        groups = OrderedDict()
+        for i, fold in pairs :
+            groups.setdefault(KernelCache.kernel_key(param_grid[i]), []).append((i, fold))
+        # sorted by fold, so that a job slices each fold's kernel blocks once
+        jobs = [sorted(group, key=lambda pair : pair[1]) for group in groups.values()]
+        if min(_num_workers(n_jobs), len(jobs)) > 1 :
+            kernel_cache.preload([param_grid[job[0][0]] for job in jobs])
+            keep_kernels = False
+    
+    def record(j, scores) :
+        for (i, fold), score in zip(jobs[j], scores) :
+            checkpoint.append(plan_id, param_grid[i], fold, metric_names, score)
+    
+    results = _map_jobs(_cv_fold_score, jobs, n_jobs,
+                        None if checkpoint is None else record,
+                        plan=plan, metrics=metric_names, param_grid=param_grid,
+                        kernel_cache=kernel_cache, keep_kernels=keep_kernels)
+    
+    for job, scores in zip(jobs, results) :
+        for pair, score in zip(job, scores) :
+            fold_scores[pair] = score
+    return fold_scores
+
+
+def cv_grid_performance(param_grid, X, y, kf, metric="accuracy", n_jobs=1,
+                        kernel_cache=None, checkpoint=None) :
+    """
+    Runs k-fold cross-validation of an SVC for every setting in param_grid.
+    Every (setting, fold) pair is an independent job, so the jobs can be
+    spread over a pool of worker processes. Each job fits once and scores
+    every requested metric from the same decision function output.
+    
+    With a kernel_cache, settings that share a kernel (e.g. the same gamma
+    but different C) are grouped into one job over all folds, and the SVCs
+    are trained on the cached kernel matrix.
+    
+    Parameters
+    --------------------
+        param_grid   -- list of dictionaries, keyword arguments for SVC
+        X            -- numpy array of shape (n,d), feature vectors
+                          n = number of examples
+                          d = number of features
+        y            -- numpy array of shape (n,), binary labels {1,-1}
+        kf           -- model_selection.KFold, model_selection.StratifiedKFold
+                        or FoldPlan
+        metric       -- string or list of strings, option(s) used to select
+                        performance measure
+        n_jobs       -- int, number of worker processes (-1 uses all cores)
+        kernel_cache -- KernelCache built from X, or None
+        checkpoint   -- Checkpoint to resume from and record scores in, or None
+    
+    Returns
+    --------------------
+        scores       -- numpy array of shape (len(param_grid),), average
+                        cross-validation performance of each setting, in the
+                        order of param_grid
+                        (shape (len(metric), len(param_grid)) for a list of metrics)
+    """
+    
+    metric_names = _metric_list(metric)
+    plan = _fold_plan(X, y, kf)
+    pairs = [(i, fold) for i in range(len(param_grid)) for fold in range(len(plan))]
+    results = _grid_fold_scores(param_grid, plan, metric_names, pairs,
+                                n_jobs, kernel_cache, checkpoint)
+    
+    # fold_scores is indexed by (setting, fold, metric)
+    fold_scores = np.zeros((len(param_grid), len(plan), len(metric_names)))
+    for (i, fold), scores in results.items() :
+        fold_scores[i, fold] = scores
+    scores = _average_scores(fold_scores.transpose(2, 0, 1))
+    if isinstance(metric, basestring) :
+        return scores[0]
+    return scores
+
+
+def cv_halving_performance(param_grid, X, y, kf, metric="accuracy", eta=3,
+                           max_fits=None, max_time=None, n_jobs=1, kernel_cache=None,
+                           checkpoint=None) :
+    """
+    Cross-validates the settings in param_grid by successive halving: all
+    settings are scored on the first fold, only the best 1/eta of them go on
+    to be scored on eta times as many folds, and so on until the survivors
+    have been scored on every fold.
+    
+    Each metric is searched separately, but a (setting, fold) pair is only
+    ever fit once, and every metric is scored from that fit.
+    
+    The first round (every setting on the first fold) is always run, so
+    every setting gets a score for every metric; max_fits and max_time only
+    stop the rounds after it (the first round counts towards max_fits).
+    
+    Parameters
+    --------------------
+        param_grid   -- list of dictionaries, keyword arguments for SVC
+        X            -- numpy array of shape (n,d), feature vectors
+        y            -- numpy array of shape (n,), binary labels {1,-1}
+        kf           -- model_selection.KFold, model_selection.StratifiedKFold
+                        or FoldPlan
+        metric       -- string or list of strings, option(s) used to select
+                        performance measure
+        eta          -- int, factor by which each round shrinks the settings
+                        and grows the folds
+        max_fits     -- int, stop before a later round that would bring the
+                        total number of fits above this, or None
+        max_time     -- float, stop before starting a later round after this
+                        many seconds, or None
+        n_jobs       -- int, number of worker processes (-1 uses all cores)
+        kernel_cache -- KernelCache built from X, or None
+        checkpoint   -- Checkpoint to resume from and record scores in, or None
+    
+    Returns
+    --------------------
+        scores       -- numpy array of shape (len(param_grid),), average
+                        performance of each setting over the folds it was
+                        scored on
+        n_folds      -- numpy array of shape (len(param_grid),), number of
+                        folds each setting was scored on
+                        (both of shape (len(metric), len(param_grid)) for a
+                        list of metrics)
+    """
+    
+    metric_names = _metric_list(metric)
+    plan = _fold_plan(X, y, kf)
+    k = len(plan)
+    start = time.time()
+    fold_scores = {}
+    
+    scores = np.zeros((len(metric_names), len(param_grid)))
+    n_folds = np.zeros((len(metric_names), len(param_grid)), dtype=int)
+    for m in range(len(metric_names)) :
+        alive = range(len(param_grid))
+        rung = 1
+        while True :
+            pairs = [(i, fold) for i in alive for fold in range(rung)
+                     if (i, fold) not in fold_scores]
+            if rung > 1 :
+                if max_fits is not None and len(fold_scores) + len(pairs) > max_fits :
+                    break
+                if max_time is not None and time.time() - start > max_time :
+                    break
+            fold_scores.update(_grid_fold_scores(param_grid, plan, metric_names,
+                                                 pairs, n_jobs, kernel_cache, checkpoint))
+            for i in alive :
+                scores[m, i] = _average_scores([fold_scores[i, fold][m] for fold in range(rung)])
+                n_folds[m, i] = rung
+            if rung == k :
+                break
+            
+            # keep the best settings (ties in grid order), then add folds
+            keep = max(int(np.ceil(len(alive) / float(eta))), 1)
+            order = np.argsort(-scores[m, alive], kind='mergesort')
+            alive = sorted(alive[j] for j in order[:keep])
+            rung = min(rung * eta, k)
+    
+    if isinstance(metric, basestring) :
+        return scores[0], n_folds[0]
+    return scores, n_folds
+
+
+def linear_svm_path(X, y, C_range, max_iter=200, tol=1e-4, random_state=0) :
+    """
+    Fits linear SVMs for a sequence of C values with a primal solver.
+    
+    Each SVM minimizes the hinge loss by stochastic gradient descent
+    (sklearn.linear_model.SGDClassifier with alpha = 1/(C n), which has the
+    same minimizer as the libsvm objective). The values of C are visited in
+    increasing order, and each solve is warm-started from the previous one.
+    The result approximates SVC(kernel='linear') but scales to large sparse
+    training sets.
+    
+    Parameters
+    --------------------
+        X            -- numpy array or scipy.sparse matrix of shape (n,d)
+        y            -- numpy array of shape (n,), binary labels {1,-1}
+        C_range      -- list of floats, values of C
+        max_iter     -- int, maximum number of epochs per value of C
+        tol          -- float, stopping tolerance of each solve
+        random_state -- int, seed for shuffling the training data
+    
+    Returns
+    --------------------
+        coefs        -- numpy array of shape (len(C_range),d), weight vectors
+        intercepts   -- numpy array of shape (len(C_range),), intercepts
+    """
+    
+    from sklearn.linear_model import SGDClassifier
+    
+    n, d = X.shape
+    clf = SGDClassifier(loss='hinge', penalty='l2', warm_start=True,
+                        max_iter=max_iter, tol=tol, random_state=random_state)
+    coefs = np.zeros((len(C_range), d))
+    intercepts = np.zeros(len(C_range))
+    for i in np.argsort(C_range) :
+        clf.set_params(alpha=1.0 / (C_range[i] * n))
+        clf.fit(X, y)
+        coefs[i] = clf.coef_[0]
+        intercepts[i] = clf.intercept_[0]
+    return coefs, intercepts
+
+
+def _cv_path_score(fold) :
+    """Fits a warm-started linear SVM path on one fold and scores every C."""
+    X_train, y_train, X_test, y_test = _GRID_STATE['plan'].fold(fold)
+    with PROFILER.timer('cv/path_fit') :
+        coefs, intercepts = linear_svm_path(X_train, y_train, _GRID_STATE['C_range'])
+    PROFILER.count('cv/fits', len(coefs))
+    # one row of predictions per value of C
+    with PROFILER.timer('cv/decision') :
+        y_pred = np.asarray(X_test.dot(coefs.T)).T + intercepts[:, np.newaxis]
+    with PROFILER.timer('cv/metrics') :
+        return performance_all(y_test, y_pred, _GRID_STATE['metrics'])
+
+
+def cv_linear_path_performance(C_range, X, y, kf, metric="accuracy", n_jobs=1,
+                               checkpoint=None) :
+    """
+    Runs k-fold cross-validation of the linear SVM path of linear_svm_path,
+    with one job per fold.
+    
+    Parameters
+    --------------------
+        C_range    -- list of floats, values of C
+        X          -- numpy array of shape (n,d), feature vectors
+        y          -- numpy array of shape (n,), binary labels {1,-1}
+        kf         -- model_selection.KFold, model_selection.StratifiedKFold
+                      or FoldPlan
+        metric     -- string or list of strings, option(s) used to select
+                      performance measure
+        n_jobs     -- int, number of worker processes (-1 uses all cores)
+        checkpoint -- Checkpoint to resume from and record scores in, or
+                      None; a fold is skipped if it holds every C
+    
+    Returns
+    --------------------
+        scores     -- numpy array of shape (len(C_range),), average
+                      cross-validation performance of each C
+                      (shape (len(metric), len(C_range)) for a list of metrics)
+    """
+    
+    metric_names = _metric_list(metric)
+    plan = _fold_plan(X, y, kf)
+    settings = [{'kernel': 'linear', 'C': C, 'solver': 'sgd'} for C in C_range]
+    results = [None] * len(plan)
+    if checkpoint is not None :
+        plan_id = Checkpoint.fingerprint(plan)
+        for fold in range(len(plan)) :
+            scores = [checkpoint.get(plan_id, params, fold, metric_names) for params in settings]
+            if all(s is not None for s in scores) :
+                results[fold] = np.transpose(scores)
+    folds = [fold for fold in range(len(plan)) if results[fold] is None]
+    
+    def record(j, scores) :
+        for params, score in zip(settings, np.transpose(scores)) :
+            checkpoint.append(plan_id, params, folds[j], metric_names, score)
+    
+    for fold, scores in zip(folds, _map_jobs(_cv_path_score, folds, n_jobs,
+                                             None if checkpoint is None else record,
+                                             plan=plan, metrics=metric_names,
+                                             C_range=C_range)) :
+        results[fold] = scores
+    
+    # results is indexed by (fold, metric, C)
+    scores = _average_scores(np.transpose(results, (1, 2, 0)))
+    if isinstance(metric, basestring) :
+        return scores[0]
+    return scores
+
+
+def select_param_linear(X, y, kf, metric="accuracy", plot=True, n_jobs=1,
+                        kernel_cache=None, backend="libsvm", checkpoint=None) :
+    """
+    Sweeps different settings for the hyperparameter of a linear-kernel SVM,
+    calculating the k-fold CV performance for each setting, then selecting the
+    hyperparameter that 'maximize' the average k-fold CV performance.
+    
+    Parameters
+    --------------------
+        X            -- numpy array of shape (n,d), feature vectors
+                          n = number of examples
+                          d = number of features
+        y            -- numpy array of shape (n,), binary labels {1,-1}
+        kf           -- model_selection.KFold, model_selection.StratifiedKFold
+                        or FoldPlan
+        metric       -- string or list of strings, option(s) used to select
+                        performance measure; every setting is fit once per fold
+                        and scored on all of them
+        plot         -- boolean, make a plot
+        n_jobs       -- int, number of worker processes (-1 uses all cores)
+        kernel_cache -- KernelCache built from X, or None; if given, the
+                        SVMs are trained on its precomputed Gram matrix
+        backend      -- string, 'libsvm' to train SVC(kernel='linear') for every C,
+                        or 'sgd' for the warm-started primal path of linear_svm_path
+        checkpoint   -- Checkpoint to resume from and record scores in, or None
+    
+    Returns
+    --------------------
+        C            -- float, optimal parameter value for linear-kernel SVM
+                        (list of floats, one per metric, for a list of metrics)
+    """
+    
+    metric_names = _metric_list(metric)
+    print 'Linear SVM Hyperparameter Selection based on ' + ', '.join(metric_names) + ':'
+    C_range = 10.0 ** np.arange(-3, 3)
+    # part 2c: select optimal hyperparameter using cross-validation
+    if backend == "libsvm" :
+        param_grid = [{'C': C, 'kernel': 'linear'} for C in C_range]
+        scores = cv_grid_performance(param_grid, X, y, kf, metric_names, n_jobs,
+                                     kernel_cache, checkpoint)
+    elif backend == "sgd" :
+        scores = cv_linear_path_performance(C_range, X, y, kf, metric_names, n_jobs,
+                                            checkpoint)
+    else :
+        raise ValueError("unknown backend %r" % backend)
+    
+    if plot:
+        for m, row in zip(metric_names, scores) :
+            lineplot(C_range, row, m)
+    
+    best_C = [C_range[np.argmax(row)] for row in scores]
+    if isinstance(metric, basestring) :
+        return best_C[0]
+    return best_C
+
+
+def select_param_rbf(X, y, kf, metric="accuracy", n_jobs=1, kernel_cache=None,
+                     search="grid", eta=3, max_fits=None, max_time=None,
+                     checkpoint=None) :
+    """
+    Sweeps different settings for the hyperparameters of an RBF-kernel SVM,
+    calculating the k-fold CV performance for each setting, then selecting the
+    hyperparameters that 'maximize' the average k-fold CV performance.
+    
+    Parameters
+    --------------------
+        X            -- numpy array of shape (n,d), feature vectors
+                          n = number of examples
+                          d = number of features
+        y            -- numpy array of shape (n,), binary labels {1,-1}
+        kf           -- model_selection.KFold, model_selection.StratifiedKFold
+                        or FoldPlan
+        metric       -- string or list of strings, option(s) used to select
+                        performance measure; every setting is fit once per fold
+                        and scored on all of them
+        n_jobs       -- int, number of worker processes (-1 uses all cores)
+        kernel_cache -- KernelCache built from X, or None; if given, each
+                        gamma's kernel is computed once and shared by all C
+        search       -- string, 'grid' to score every setting on every fold,
+                        or 'halving' for cv_halving_performance
+        eta          -- int, halving factor of the 'halving' search
+        max_fits     -- int, budget of fits of the 'halving' search, or None
+        max_time     -- float, budget in seconds of the 'halving' search, or None
+                        (the first round of the search is always run)
+        checkpoint   -- Checkpoint to resume from and record scores in, or None
+    
+    Returns
+    --------------------
+        score        -- float, best average k-fold CV performance
+        C            -- float, optimal parameter value for an RBF-kernel SVM
+        gamma        -- float, optimal parameter value for an RBF-kernel SVM
+                        (list of (score, C, gamma) tuples, one per metric, for a
+                        list of metrics)
+    """
+    
+    metric_names = _metric_list(metric)
+    print 'RBF SVM Hyperparameter Selection based on ' + ', '.join(metric_names) + ':'
+    
+    ### ========== TODO : START ========== ###
+    # part 3b: create grid, then select optimal hyperparameters using cross-validation
+
+    C_range = 10.0 ** np.arange(-1, 3)
+    gamma_range = np.arange(0.0001, 0.05, 0.001)
+
+    param_grid = [{'kernel': 'rbf', 'C': C, 'gamma': gamma}
+                  for C in C_range for gamma in gamma_range]
+    if search == "grid" :
+        table = cv_grid_performance(param_grid, X, y, kf, metric_names, n_jobs,
+                                    kernel_cache, checkpoint)
+    elif search == "halving" :
+        table, n_folds = cv_halving_performance(param_grid, X, y, kf, metric_names,
+                                                eta, max_fits, max_time, n_jobs,
+                                                kernel_cache, checkpoint)
+        # only the settings that were scored on the most folds compete; the
+        # other averages come from fewer folds and are not comparable
+        table[n_folds < n_folds.max(axis=1)[:, np.newaxis]] = np.nan
+    else :
+        raise ValueError("unknown search %r" % search)
+
+    results = []
+    for m, row in zip(metric_names, table) :
+        scores = row.reshape(len(C_range), len(gamma_range))
+        print m
+        print scores
+
+        max_score = 0
+        max_c = 0
+        max_gamma = 0
+        for i in range(len(C_range)) :
+            for j in range(len(gamma_range)) :
+                if scores[i][j] > max_score:
+                    max_score = scores[i][j]
+                    max_c = i
+                    max_gamma = j
+        results.append((max_score, C_range[max_c], gamma_range[max_gamma]))
+
+    if isinstance(metric, basestring) :
+        return results[0]
+    return results
+    ### ========== TODO : END ========== ###
+
+
+def bootstrap_performance(y_true, y_pred, metric="accuracy", t=1000,
+                          percentiles=(2.5, 97.5)) :
+    """
+    Estimates the bootstrap distribution of one or more performance metrics
+    for fixed predictions.
+    
+    All t resamples are drawn at once as a (t,n) array of indices. Each
+    resample is then summarized by counts, with no per-resample loop:
+    confusion counts come from a single bincount, and AUROC comes from the
+    Mann-Whitney rank statistic over per-resample counts of positive and
+    negative examples at each distinct score.
+    
+    Parameters
+    --------------------
+        y_true       -- numpy array of shape (n,), binary labels {1,-1}
+        y_pred       -- numpy array of shape (n,), (continuous-valued) predictions
+        metric       -- string or list of strings, option(s) used to select
+                        performance measure
+        t            -- int, number of bootstrap resamples
+        percentiles  -- pair of floats, percentiles (0-100) of the bootstrap
+                        distribution reported as the confidence interval
+    
+    Returns
+    --------------------
+        score        -- float, mean performance across resamples
+        lower        -- float, lower limit of confidence interval
+        upper        -- float, upper limit of confidence interval
+                        (list of (score, lower, upper), one per metric, for a
+                        list of metrics)
+    """
+    
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred, dtype=float)
+    n = len(y_true)
+    PROFILER.count('test/resamples', t)
+    
+    idx = np.random.randint(0, n, (t, n))
+    replicate = np.arange(t).repeat(n)
+    pos = (y_true == 1).astype(np.intp)
+    # map points of hyperplane to +1, as in performance
+    pred_pos = (y_pred >= 0).astype(np.intp)
+    
+    # confusion counts per resample, columns are (tn, fp, fn, tp)
+    cells = 2 * pos + pred_pos
+    confusion = np.bincount(replicate * 4 + cells[idx].ravel(),
+                            minlength=4 * t).reshape(t, 4)
+    tn, fp, fn, tp = confusion.T
+    
+    results = []
+    for m in _metric_list(metric) :
+        if m == "auroc" :
+            # per resample, number of negatives and positives at each distinct score
+            values, inverse = np.unique(y_pred, return_inverse=True)
+            b = len(values)
+            keys = (replicate * b + inverse[idx].ravel()) * 2 + pos[idx].ravel()
+            weights = np.bincount(keys, minlength=2 * b * t).reshape(t, b, 2)
+            neg_w, pos_w = weights[:, :, 0], weights[:, :, 1]
+            # each positive beats the negatives with a lower score and ties half of
+            # those with the same score
+            below = np.cumsum(neg_w, axis=1) - neg_w
+            wins = (pos_w * (below + 0.5 * neg_w)).sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore') :
+                scores = wins / (pos_w.sum(axis=1) * neg_w.sum(axis=1)).astype(float)
+        else :
+            scores = _scores_from_counts(tp, fp, fn, tn, m)
+        
+        # resamples where the metric is undefined (e.g. a single class) are dropped
+        sorted_scores = np.sort(scores[~np.isnan(scores)])
+        k = len(sorted_scores)
+        lo, hi = [min(max(int(round(p / 100. * k)) - 1, 0), k - 1) for p in percentiles]
+        results.append((np.mean(sorted_scores), sorted_scores[lo], sorted_scores[hi]))
+    
+    if isinstance(metric, basestring) :
+        return results[0]
+    return results
+
+
+def performance_CI(clf, X, y, metric="accuracy", t=1000, percentiles=(2.5, 97.5)) :
+    """
+    Estimates the performance of the classifier using the 95% CI.
+    
+    The classifier is evaluated on the test set once; the bootstrap resamples
+    reuse those predictions (see bootstrap_performance).
+    
+    Parameters
+    --------------------
+        clf          -- classifier (instance of SVC or DummyClassifier)
+                          [already fit to data]
+        X            -- numpy array of shape (n,d), feature vectors of test set
+                          n = number of examples
+                          d = number of features
+        y            -- numpy array of shape (n,), binary labels {1,-1} of test set
+        metric       -- string or list of strings, option(s) used to select
+                        performance measure
+        t            -- int, number of bootstrap resamples
+        percentiles  -- pair of floats, percentiles (0-100) reported as the
+                        confidence interval
+    
+    Returns
+    --------------------
+        score        -- float, classifier performance
+        lower        -- float, lower limit of confidence interval
+        upper        -- float, upper limit of confidence interval
+                        (list of (score, lower, upper), one per metric, for a
+                        list of metrics)
+    """
+    
+    with PROFILER.timer('test/decision') :
+        try :
+            y_pred = clf.decision_function(X)
+        except :
+            y_pred = clf.predict(X)
+    
+    with PROFILER.timer('test/bootstrap') :
+        return bootstrap_performance(y, y_pred, metric, t, percentiles)
+    ### ========== TODO : END ========== ###
+
+
+######################################################################
+# functions -- scoring
+######################################################################
+
+def _dense(a) :
+    """Converts a (possibly sparse) matrix to a numpy array."""
+    return a.toarray() if sparse.issparse(a) else np.asarray(a)
+
+
+def linear_weights(clf) :
     """
-    Reads and returns a vector from a file.
+    Returns the weight vector and intercept of a linear classifier, or None
+    if the classifier is not linear.
     
     Parameters
     --------------------
-        fname  -- string, filename
+        clf -- classifier [already fit to data]
     
     Returns
     --------------------
-        labels -- numpy array of shape (n,)
-                    n is the number of non-blank lines in the text file
+        w   -- numpy array of shape (d,), weights
+        b   -- float, intercept
     """
-    return np.genfromtxt(fname)
+    if getattr(clf, 'kernel', 'linear') != 'linear' or not hasattr(clf, 'coef_') :
+        return None
+    return _dense(clf.coef_).ravel(), float(np.ravel(clf.intercept_)[0])
 
 
-def write_label_answer(vec, outfile) :
+def linear_weights_matrix(classifiers) :
     """
-    Writes your label vector to the given file.
-    
-    Parameters
-    --------------------
-        vec     -- numpy array of shape (n,) or (n,1), predicted scores
-        outfile -- string, output filename
+    Stacks the weight vectors of several fitted linear classifiers (e.g. one
+    per fold or per value of C) into a numpy array of shape (m,d), for
+    batch queries with top_features.
     """
-    
-    # for this project, you should predict 70 labels
-    if(vec.shape[0] != 70):
-        print("Error - output vector should have 70 rows.")
-        print("Aborting write.")
-        return
-    
-    np.savetxt(outfile, vec)    
+    return np.vstack([linear_weights(clf)[0] for clf in classifiers])
 
 
-######################################################################
-# functions -- feature extraction
-######################################################################
-
-def extract_words(input_string) :
+def top_features(weights, vocab, k=10) :
     """
-    Processes the input_string, separating it into "words" based on the presence
-    of spaces, and separating punctuation marks into their own words.
+    Returns the k words with the largest positive weights and the k words
+    with the most negative weights of one or more linear models.
+    
+    Each row is partitioned with np.argpartition, so a query costs O(d + k
+    log k) instead of a full sort. Words are looked up through the
+    vocabulary's index -> word array rather than by searching the
+    dictionary. Ties at the k-th weight are broken arbitrarily.
     
     Parameters
     --------------------
-        input_string -- string of characters
+        weights  -- numpy array of shape (d,), weight vector of one model,
+                    or of shape (m,d), one row per model (see linear_weights
+                    and linear_weights_matrix)
+        vocab    -- Vocabulary, or dictionary with (key, value) pairs
+                    (word, index)
+        k        -- int, number of words of each sign
     
     Returns
     --------------------
-        words        -- list of lowercase "words"
+        positive -- list of k (word, weight) pairs, largest weight first
+        negative -- list of k (word, weight) pairs, most negative weight first
+                    (lists of m such lists, one per model, for 2-d weights)
     """
     
-    for c in punctuation :
-        input_string = input_string.replace(c, ' ' + c + ' ')
-    return input_string.lower().split()
+    if not isinstance(vocab, Vocabulary) :
+        vocab = Vocabulary(sorted(vocab, key=vocab.get))
+    W = np.atleast_2d(np.asarray(weights, dtype=float))
+    k = min(k, W.shape[1])
+    rows = np.arange(W.shape[0])[:, np.newaxis]
+    
+    results = []
+    for sign in (-1, 1) :
+        # the k smallest entries of sign * W, in increasing order
+        keys = sign * W
+        top = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        top = top[rows, np.argsort(keys[rows, top], axis=1, kind='mergesort')]
+        words, values = vocab.decode(top), W[rows, top]
+        results.append([zip(w, v) for w, v in zip(words.tolist(), values)])
+    
+    positive, negative = results
+    if np.ndim(weights) == 1 :
+        return positive[0], negative[0]
+    return positive, negative
 
 
-def extract_dictionary(infile) :
+def decision_function(clf) :
     """
-    Given a filename, reads the text file and builds a dictionary of unique
-    words/punctuations.
+    Returns a function mapping feature vectors to continuous-valued
+    predictions. For linear classifiers this is a sparse dot product with
+    the weight vector, otherwise the classifier's own decision_function (or
+    predict, for classifiers without one).
     
     Parameters
     --------------------
-        infile    -- string, filename
+        clf -- classifier [already fit to data]
     
     Returns
     --------------------
-        word_list -- dictionary, (key, value) pairs are (word, index)
+        f   -- function, f(X) is a numpy array of shape (n,)
     """
-    
-    word_list = {}
-    index = 0
-    with open(infile, 'rU') as fid :
-        for line in fid :
-            words = extract_words(line)
-            for i in range(len(words)):
-                if words[i] not in word_list :
-                    word_list[words[i]] = index
-                    index+=1
-
-    return word_list
+    weights = linear_weights(clf)
+    if weights is not None :
+        w, b = weights
+        return lambda X : X.dot(w) + b
+    if hasattr(clf, 'decision_function') :
+        return clf.decision_function
+    return clf.predict
 
 
-def extract_feature_vectors(infile, word_list) :
+def score_file(clf, word_list, infile, outfile, batch_size=1000, binary=False) :
     """
-    Produces a bag-of-words representation of a text file specified by the
-    filename infile based on the dictionary word_list.
+    Scores every line of a text file and streams the continuous-valued
+    predictions to outfile, one micro-batch of lines at a time.
     
     Parameters
     --------------------
-        infile         -- string, filename
-        word_list      -- dictionary, (key, value) pairs are (word, index)
+        clf        -- classifier [already fit to data]
+        word_list  -- dictionary, (key, value) pairs are (word, index)
+        infile     -- string, filename, or file object (e.g. sys.stdin)
+        outfile    -- string, filename, or file object (e.g. sys.stdout)
+        batch_size -- int, number of lines scored at a time
+        binary     -- boolean, write little-endian float64 values instead of
+                      one value per line of text
     
     Returns
     --------------------
-        feature_matrix -- numpy array of shape (n,d)
-                          boolean (0,1) array indicating word presence in a string
-                            n is the number of non-blank lines in the text file
-                            d is the number of unique words in the text file
+        n          -- int, number of lines scored
     """
     
-    num_lines = sum(1 for line in open(infile,'rU'))
-    num_words = len(word_list)
-    feature_matrix = np.zeros((num_lines, num_words))
-    
-    with open(infile, 'rU') as fid :
-        i = 0
-        for line in fid :
-            for j in range(num_words) :
-                word = word_list.keys()[word_list.values().index(j)]
-                if word in extract_words(line) :
-                    feature_matrix[i][j] = 1
-            i+=1   
-             
-    return feature_matrix
+    score = decision_function(clf)
+    fid = outfile if hasattr(outfile, 'write') else open(outfile, 'wb')
+    n = 0
+    try :
+        for lines in iter_lines(infile, batch_size) :
+            y_pred = np.asarray(score(lines_to_csr(lines, word_list)), dtype='<f8')
+            if binary :
+                fid.write(y_pred.tostring())
+            else :
+                np.savetxt(fid, y_pred)
+            fid.flush()
+            n += len(lines)
+    finally :
+        if fid is not outfile :
+            fid.close()
+    return n
 
 
-def test_extract_dictionary(dictionary) :
-    err = "extract_dictionary implementation incorrect"
-    
-    assert len(dictionary) == 1811, err
-    
-    exp = [('2012', 0),
-           ('carol', 10),
-           ('ve', 20),
-           ('scary', 30),
-           ('vacation', 40),
-           ('just', 50),
-           ('excited', 60),
-           ('no', 70),
-           ('cinema', 80),
-           ('frm', 90)]
-    act = [sorted(dictionary.items(), key=lambda it: it[1])[i] for i in range(0,100,10)]
-    assert exp == act, err
+def _json_params(params) :
+    """Keeps the hyperparameters that can be stored as JSON."""
+    return dict((k, v) for k, v in params.items()
+                if v is None or isinstance(v, (bool, int, long, float, basestring)))
 
 
-def test_extract_feature_vectors(X) :
-    err = "extract_features_vectors implementation incorrect"
+def save_model(path, clf, word_list, params=None) :
+    """
+    Saves a trained classifier together with the dictionary it was trained
+    with and its hyperparameters, as a directory of .npy arrays and a JSON
+    header (meta.json).
     
-    assert X.shape == (630, 1811), err
+    Linear classifiers are stored as a float32 weight vector and an
+    intercept. Kernel SVCs are stored as their support vectors (as CSR
+    arrays) and dual coefficients. Classifiers without a decision function
+    that predict a single class (e.g. DummyClassifier) are stored as that
+    class. Every array can be memory-mapped by load_model.
     
-    exp = np.array([[ 1.,  1.,  1.,  1.,  1.,  1.,  1.,  1.,  1.,  1.],
-                    [ 1.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  1.],
-                    [ 0.,  1.,  0.,  0.,  0.,  0.,  0.,  0.,  1.,  1.],
-                    [ 0.,  0.,  0.,  0.,  0.,  1.,  0.,  0.,  1.,  1.],
-                    [ 0.,  1.,  0.,  0.,  0.,  1.,  0.,  0.,  1.,  1.],
-                    [ 0.,  0.,  0.,  1.,  0.,  0.,  0.,  0.,  1.,  1.],
-                    [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  1.,  1.],
-                    [ 0.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  1.,  1.],
-                    [ 0.,  1.,  0.,  0.,  1.,  0.,  0.,  0.,  1.,  1.],
-                    [ 0.,  1.,  0.,  0.,  0.,  0.,  0.,  0.,  0.,  1.]])
-    act = X[:10,:10]
-    assert (exp == act).all(), err
-
+    Parameters
+    --------------------
+        path      -- string, directory to create
+        clf       -- classifier (instance of SVC or DummyClassifier)
+                       [already fit to data]
+        word_list -- dictionary, (key, value) pairs are (word, index)
+        params    -- dictionary, hyperparameters to record
+                       (default: clf.get_params())
+    """
+    
+    if params is None :
+        params = clf.get_params() if hasattr(clf, 'get_params') else {}
+    meta = {'params': _json_params(params)}
+    token_bytes, token_offsets = pack_tokens(sorted(word_list, key=word_list.get))
+    arrays = {'token_bytes': token_bytes, 'token_offsets': token_offsets}
+    
+    weights = linear_weights(clf)
+    if weights is not None :
+        w, b = weights
+        meta.update(kind='linear', intercept=b)
+        arrays['weights'] = w.astype(np.float32)
+    elif getattr(clf, 'kernel', None) == 'rbf' :
+        sv = sparse.csr_matrix(clf.support_vectors_)
+        meta.update(kind='rbf', gamma=float(clf._gamma),
+                    intercept=float(np.ravel(clf.intercept_)[0]))
+        arrays.update(sv_data=sv.data, sv_indices=sv.indices, sv_indptr=sv.indptr,
+                      sv_shape=np.array(sv.shape),
+                      dual_coef=_dense(clf.dual_coef_).ravel().astype(np.float64))
+    elif not hasattr(clf, 'decision_function') and hasattr(clf, 'classes_') :
+        y_pred = np.unique(clf.predict(sparse.csr_matrix((1, len(word_list)))))
+        meta.update(kind='constant', value=float(y_pred[0]))
+    else :
+        raise ValueError("cannot save a %s" % type(clf).__name__)
+    
+    if not os.path.isdir(path) :
+        os.makedirs(path)
+    for name, array in arrays.items() :
+        np.save(os.path.join(path, name + '.npy'), array)
+    with open(os.path.join(path, 'meta.json'), 'w') as fid :
+        json.dump(meta, fid, indent=1, sort_keys=True)
 
-######################################################################
-# functions -- evaluation
-######################################################################
 
-def performance(y_true, y_pred, metric="accuracy") :
+def load_model(path, mmap=True) :
     """
-    Calculates the performance metric based on the agreement between the 
-    true labels and the predicted labels.
+    Loads a classifier and its dictionary saved by save_model.
     
     Parameters
     --------------------
-        y_true -- numpy array of shape (n,), known labels
-        y_pred -- numpy array of shape (n,), (continuous-valued) predictions
-        metric -- string, option used to select the performance measure
-                  options: 'accuracy', 'f1_score', 'auroc', 'precision',
-                           'sensitivity', 'specificity'        
+        path      -- string, directory written by save_model
+        mmap      -- boolean, memory-map the arrays instead of reading them
     
     Returns
     --------------------
-        score  -- float, performance score
+        clf       -- LinearModel, RBFModel or ConstantModel, with the saved
+                     hyperparameters in clf.params
+        word_list -- dictionary, (key, value) pairs are (word, index)
     """
-    # map continuous-valued predictions to binary labels
-    y_label = np.sign(y_pred)
-    y_label[y_label==0] = 1 # map points of hyperplane to +1
-    
-    # part 2a: compute classifier performance
-    if metric == "accuracy":
-        return metrics.accuracy_score(y_true, y_label)
-    elif metric == "f1_score":
-        return metrics.f1_score(y_true, y_label) 
-    elif metric == "auroc":
-        return metrics.roc_auc_score(y_true, y_pred)
-    elif metric == "precision":
-        return metrics.precision_score(y_true, y_label)
-    elif metric == "sensitivity":
-        return metrics.recall_score(y_true , y_label)
-    elif metric == "specificity":
-        CMatrix = metrics.confusion_matrix(y_true , y_label)
-        TN = CMatrix[0][0]
-        FP = CMatrix[0][1]
-        return float(TN) / (float(TN) + float(FP))
-    else:
-        return "Input has wrong metric"
-
-
-
-def test_performance() :
-    # np.random.seed(1234)
-    # y_true = 2 * np.random.randint(0,2,10) - 1
-    # np.random.seed(2345)
-    # y_pred = (10 + 10) * np.random.random(10) - 10
     
-    y_true = [ 1,  1, -1,  1, -1, -1, -1,  1,  1,  1]
-    #y_pred = [ 1, -1,  1, -1,  1,  1, -1, -1,  1, -1]
-    # confusion matrix
-    #          pred pos     neg
-    # true pos      tp (2)  fn (4)
-    #      neg      fp (3)  tn (1)
-    y_pred = [ 3.21288618, -1.72798696,  3.36205116, -5.40113156,  6.15356672,
-               2.73636929, -6.55612296, -4.79228264,  8.30639981, -0.74368981]
-    metrics = ["accuracy", "f1_score", "auroc", "precision", "sensitivity", "specificity"]
-    scores  = [     3/10.,      4/11.,  5/12.,       2/5.,          2/6.,          1/4.]
+    mmap_mode = 'r' if mmap else None
+    load = lambda name : np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+    with open(os.path.join(path, 'meta.json')) as fid :
+        meta = json.load(fid)
     
-    import sys
-    eps = sys.float_info.epsilon
+    tokens = unpack_tokens(load('token_bytes'), load('token_offsets'))
+    word_list = dict(zip(tokens, xrange(len(tokens))))
     
-    for i, metric in enumerate(metrics) :
-        assert abs(performance(y_true, y_pred, metric) - scores[i]) < eps, \
-            (metric, performance(y_true, y_pred, metric), scores[i])
+    kind = meta['kind']
+    if kind == 'linear' :
+        clf = LinearModel(load('weights'), meta['intercept'])
+    elif kind == 'rbf' :
+        sv = sparse.csr_matrix((load('sv_data'), load('sv_indices'), load('sv_indptr')),
+                               shape=tuple(load('sv_shape')))
+        clf = RBFModel(sv, load('dual_coef'), meta['intercept'], meta['gamma'])
+    elif kind == 'constant' :
+        clf = ConstantModel(meta['value'])
+    else :
+        raise ValueError("unknown model kind %r" % kind)
+    clf.params = meta['params']
+    return clf, word_list
 
 
-def cv_performance(clf, X, y, kf, metric="accuracy") :
+def score_main(argv) :
     """
-    Splits the data, X and y, into k-folds and runs k-fold cross-validation.
-    Trains classifier on k-1 folds and tests on the remaining fold.
-    Calculates the k-fold cross-validation performance metric for classifier
-    by averaging the performance across folds.
+    Command line entry point for scoring tweets with a saved model:
     
-    Parameters
-    --------------------
-        clf    -- classifier (instance of SVC)
-        X      -- numpy array of shape (n,d), feature vectors
-                    n = number of examples
-                    d = number of features
-        y      -- numpy array of shape (n,), binary labels {1,-1}
-        kf     -- model_selection.KFold or model_selection.StratifiedKFold
-        metric -- string, option used to select performance measure
+        python twitter.py score MODEL [INFILE] [-o OUTFILE] [--binary]
     
-    Returns
-    --------------------
-        score   -- float, average cross-validation performance across k folds
+    INFILE and OUTFILE default to standard input and output.
     """
     
-    scores = []
-    for train, test in kf.split(X, y) :
-        X_train, X_test, y_train, y_test = X[train], X[test], y[train], y[test]
-        clf.fit(X_train, y_train)
-        # use SVC.decision_function to make ``continuous-valued'' predictions
-        y_pred = clf.decision_function(X_test)
-        score = performance(y_test, y_pred, metric)
-        if not np.isnan(score) :
-            scores.append(score)
-    return np.array(scores).mean()
+    parser = argparse.ArgumentParser(prog='twitter.py score',
+                                     description='Score tweets with a saved model.')
+    parser.add_argument('model', help='model directory written by save_model')
+    parser.add_argument('infile', nargs='?', default='-',
+                        help='tweets, one per line (default: stdin)')
+    parser.add_argument('-o', '--outfile', default='-',
+                        help='decision values (default: stdout)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='number of tweets scored at a time')
+    parser.add_argument('--binary', action='store_true',
+                        help='write float64 values instead of text')
+    args = parser.parse_args(argv)
+    
+    clf, word_list = load_model(args.model)
+    infile = sys.stdin if args.infile == '-' else args.infile
+    outfile = sys.stdout if args.outfile == '-' else args.outfile
+    score_file(clf, word_list, infile, outfile, args.batch_size, args.binary)
 
 
-def select_param_linear(X, y, kf, metric="accuracy", plot=True) :
+def progress_main(argv) :
     """
-    Sweeps different settings for the hyperparameter of a linear-kernel SVM,
-    calculating the k-fold CV performance for each setting, then selecting the
-    hyperparameter that 'maximize' the average k-fold CV performance.
+    Command line entry point for watching a checkpoint, e.g. of a run that
+    is still in progress:
     
-    Parameters
-    --------------------
-        X      -- numpy array of shape (n,d), feature vectors
-                    n = number of examples
-                    d = number of features
-        y      -- numpy array of shape (n,), binary labels {1,-1}
-        kf     -- model_selection.KFold or model_selection.StratifiedKFold
-        metric -- string, option used to select performance measure
-        plot   -- boolean, make a plot
+        python twitter.py progress FILE [--metric METRIC] [--top N]
     
-    Returns
-    --------------------
-        C -- float, optimal parameter value for linear-kernel SVM
+    Prints the average scores recorded so far for every setting, best first
+    by METRIC, with the number of folds each average is over.
     """
     
-    print 'Linear SVM Hyperparameter Selection based on ' + str(metric) + ':'
-    C_range = 10.0 ** np.arange(-3, 3)
-    scores = [0 for _ in xrange(len(C_range))] # dummy values, feel free to change
-    # part 2c: select optimal hyperparameter using cross-validation
-    for i in range(len(C_range)):
-        clf = SVC(C_range[i], kernel = 'linear')
-        scores[i] = cv_performance(clf, X, y, kf, metric)
-    
-    
-    if plot:
-        lineplot(C_range, scores, metric)
+    parser = argparse.ArgumentParser(prog='twitter.py progress',
+                                     description='Show the scores recorded in a checkpoint.')
+    parser.add_argument('checkpoint', help='checkpoint written by --checkpoint')
+    parser.add_argument('--metric', default='accuracy', choices=METRICS,
+                        help='metric to sort by (default: accuracy)')
+    parser.add_argument('--top', type=int, default=20,
+                        help='number of settings shown (default: 20)')
+    args = parser.parse_args(argv)
     
-    return C_range[np.argmax(scores)]
+    rows = Checkpoint(args.checkpoint).table()
+    m = METRICS.index(args.metric)
+    rows.sort(key=lambda row : -np.nan_to_num(row[2][m]))
+    print '%-50s %5s %s' % ('setting', 'folds', ' '.join('%11s' % name[:11] for name in METRICS))
+    for params, n_folds, scores in rows[:args.top] :
+        print '%-50s %5d %s' % (json.dumps(params, sort_keys=True)[:50], n_folds,
+                                ' '.join('%11.4f' % score for score in scores))
+    print '%d settings, %d records' % (len(rows), sum(row[1] for row in rows))
 
 
-def select_param_rbf(X, y, kf, metric="accuracy") :
+######################################################################
+# classes -- saved models
+######################################################################
+
+class LinearModel(object) :
     """
-    Sweeps different settings for the hyperparameters of an RBF-kernel SVM,
-    calculating the k-fold CV performance for each setting, then selecting the
-    hyperparameters that 'maximize' the average k-fold CV performance.
-    
-    Parameters
-    --------------------
-        X       -- numpy array of shape (n,d), feature vectors
-                     n = number of examples
-                     d = number of features
-        y       -- numpy array of shape (n,), binary labels {1,-1}
-        kf      -- model_selection.KFold or model_selection.StratifiedKFold
-        metric  -- string, option used to select performance measure
-    
-    Returns
-    --------------------
-        C        -- float, optimal parameter value for an RBF-kernel SVM
-        gamma    -- float, optimal parameter value for an RBF-kernel SVM
+    Linear classifier loaded by load_model, f(x) = w.x + b. It exposes
+    coef_ and intercept_ like a fitted linear SVC.
     """
     
-    print 'RBF SVM Hyperparameter Selection based on ' + str(metric) + ':'
+    kernel = 'linear'
     
-    ### ========== TODO : START ========== ###
-    # part 3b: create grid, then select optimal hyperparameters using cross-validation
+    def __init__(self, w, b) :
+        self.coef_ = w[np.newaxis, :]
+        self.intercept_ = np.array([b])
+    
+    def decision_function(self, X) :
+        return X.dot(self.coef_[0]) + self.intercept_[0]
 
-    C_range = 10.0 ** np.arange(-1, 3)
-    gamma_range = np.arange(0.0001, 0.05, 0.001)
 
-    scores = np.zeros((len(C_range), len(gamma_range)))
+class RBFModel(object) :
+    """
+    RBF-kernel SVM loaded by load_model,
+    f(x) = sum_i a_i exp(-gamma ||x - s_i||^2) + b over the support vectors s_i.
+    """
+    
+    kernel = 'rbf'
+    
+    def __init__(self, support_vectors, dual_coef, intercept, gamma) :
+        self.support_vectors_ = support_vectors
+        self.dual_coef_ = dual_coef
+        self.intercept_ = np.array([intercept])
+        self.gamma = gamma
+        self._sv_sq_norms = np.asarray(support_vectors.multiply(support_vectors).sum(axis=1)).ravel()
+    
+    def decision_function(self, X) :
+        X = sparse.csr_matrix(X, dtype=np.float64)
+        sq_norms = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+        dots = _dense(X.dot(self.support_vectors_.T))
+        sq_dist = np.maximum(sq_norms[:, np.newaxis] + self._sv_sq_norms - 2 * dots, 0)
+        return np.exp(-self.gamma * sq_dist).dot(self.dual_coef_) + self.intercept_[0]
 
-    for i in range(len(C_range)) :
-        for j in range(len(gamma_range)) :
-            scores[i][j] = cv_performance(SVC(kernel='rbf', C=C_range[i], gamma=gamma_range[j]), X, y, kf, metric)
-    print scores
 
-    max_score = 0
-    max_c = 0
-    max_gamma = 0
-    for i in range(len(C_range)) :
-        for j in range(len(gamma_range)) :
-            if scores[i][j] > max_score:
-                max_score = scores[i][j]
-                max_c = i
-                max_gamma = j
+class ConstantModel(object) :
+    """Classifier loaded by load_model that predicts the same label for every input."""
+    
+    def __init__(self, value) :
+        self.value = value
+    
+    def predict(self, X) :
+        return np.repeat(self.value, X.shape[0])
 
-    return max_score, C_range[max_c], gamma_range[max_gamma]
-    ### ========== TODO : END ========== ###
 
+######################################################################
+# functions and classes -- incremental training
+######################################################################
 
-def performance_CI(clf, X, y, metric="accuracy") :
+def read_new_lines(fname, offset) :
     """
-    Estimates the performance of the classifier using the 95% CI.
+    Reads the complete lines appended to a file since byte offset. A final
+    line without a line terminator is left for the next call.
     
     Parameters
     --------------------
-        clf          -- classifier (instance of SVC or DummyClassifier)
-                          [already fit to data]
-        X            -- numpy array of shape (n,d), feature vectors of test set
-                          n = number of examples
-                          d = number of features
-        y            -- numpy array of shape (n,), binary labels {1,-1} of test set
-        metric       -- string, option used to select performance measure
+        fname  -- string, filename
+        offset -- int, byte offset of the first unread line
     
     Returns
     --------------------
-        score        -- float, classifier performance
-        lower        -- float, lower limit of confidence interval
-        upper        -- float, upper limit of confidence interval
+        lines  -- list of strings, with their line terminators
     """
-    
-    try :
-        y_pred = clf.decision_function(X)
-    except :
-        y_pred = clf.predict(X)
-    score = performance(y, y_pred, metric)
-
-    n,d = X.shape
-    t = 1000
-    scores = np.zeros(t)
-
-    for i in range(t):
-        random_guess = np.random.randint(0, n, (1,n))[0]
-        new_X = np.zeros((n, d))
-        new_y = np.zeros(n)
-        for j in range(n):
-            new_X[j] = X[j]
-            new_y[j] = y[j]
-        try :
-            y_pred = clf.decision_function(X)
-        except :
-            y_pred = clf.predict(new_X)
-        scores[i] = performance(new_y, y_pred, metric)
+    with open(fname, 'rb') as fid :
+        fid.seek(offset)
+        lines = fid.read().splitlines(True)
+    if lines and not lines[-1].endswith(('\n', '\r')) :
+        lines.pop()
+    return lines
 
-    sorted_scores = np.sort(scores)
-    return np.mean(scores), sorted_scores[24], sorted_scores[974]
-    ### ========== TODO : END ========== ###
+
+class IncrementalTrainer(object) :
+    """
+    Keeps a vocabulary, a feature matrix and a linear SVM up to date with a
+    tweet file and its label file that are only ever appended to.
+    
+    Each call to update reads only the lines appended since the previous
+    call. New words get new indices after the existing ones, so old columns
+    keep their meaning. The feature matrix grows by new rows and columns: it
+    is kept as a list of CSR row blocks, one per update, and old blocks are
+    never copied or widened (each keeps the width the vocabulary had when it
+    was encoded). The SVM, trained by SGDClassifier on the hinge loss, takes
+    a few partial_fit passes over the new rows only, with its weight vector
+    padded with zeros for the new words. An update thus costs time in
+    proportion to the new lines, not to the history.
+    """
+    
+    def __init__(self, infile, labelfile, alpha=1e-4, n_passes=5, random_state=0) :
+        """
+        Parameters
+        --------------------
+            infile       -- string, filename of tweets
+            labelfile    -- string, filename of labels (one per line)
+            alpha        -- float, regularization strength of the SVM
+            n_passes     -- int, number of partial_fit passes over new rows
+            random_state -- int, seed of the SGD solver
+        """
+        from sklearn.linear_model import SGDClassifier
+        
+        self.infile = infile
+        self.labelfile = labelfile
+        self.n_passes = n_passes
+        self.offsets = [0, 0]
+        self.vocab = Vocabulary()
+        self.blocks = []
+        self.label_blocks = []
+        self.clf = SGDClassifier(loss='hinge', penalty='l2', alpha=alpha,
+                                 random_state=random_state)
+    
+    def update(self) :
+        """
+        Ingests the tweets and labels appended since the last update and
+        updates the classifier with them.
+        
+        Returns
+        --------------------
+            n -- int, number of new examples
+        """
+        
+        lines = self._new_lines(0, self.infile)
+        labels = self._new_lines(1, self.labelfile)
+        # only take tweets whose labels have arrived (and vice versa)
+        n = min(len(lines), len(labels))
+        if n == 0 :
+            return 0
+        lines, labels = lines[:n], labels[:n]
+        self.offsets[0] += sum(len(line) for line in lines)
+        self.offsets[1] += sum(len(label) for label in labels)
+        
+        X_new = self.vocab.encode(lines, grow=True)
+        y_new = np.array([float(label) for label in labels])
+        d = len(self.vocab)
+        self.blocks.append(X_new)
+        self.label_blocks.append(y_new.astype(np.int8))
+        
+        if getattr(self.clf, 'coef_', None) is not None and self.clf.coef_.shape[1] < d :
+            pad = d - self.clf.coef_.shape[1]
+            self.clf.coef_ = np.hstack([self.clf.coef_, np.zeros((1, pad))])
+        for _ in range(self.n_passes) :
+            self.clf.partial_fit(X_new, y_new, classes=np.array([-1., 1.]))
+        return n
+    
+    @property
+    def X(self) :
+        """
+        scipy.sparse.csr_matrix of shape (n,d), the feature vectors of every
+        example so far, stacked from the row blocks on each access.
+        """
+        return stack_feature_blocks(self.blocks, len(self.vocab))
+    
+    @property
+    def y(self) :
+        """numpy array of shape (n,), dtype int8, the labels of every example so far."""
+        return np.concatenate(self.label_blocks or [np.zeros(0, dtype=np.int8)])
+    
+    def _new_lines(self, k, fname) :
+        """
+        Reads the lines of fname after self.offsets[k]. If the last line read
+        before ended in '\r' and the new data starts with '\n', the two were
+        a '\r\n' split across updates, and the '\n' is skipped rather than
+        read as an empty line.
+        """
+        lines = read_new_lines(fname, self.offsets[k])
+        if lines and lines[0] == '\n' and self.offsets[k] > 0 :
+            with open(fname, 'rb') as fid :
+                fid.seek(self.offsets[k] - 1)
+                if fid.read(1) == '\r' :
+                    self.offsets[k] += 1
+                    lines.pop(0)
+        return lines
+    
+    def save(self, fname) :
+        """
+        Saves the trainer's state (including the feature row blocks), so a
+        later run can continue from it.
+        """
+        with open(fname, 'wb') as fid :
+            pickle.dump(self, fid, pickle.HIGHEST_PROTOCOL)
+    
+    @staticmethod
+    def load(fname) :
+        """Loads a trainer saved by save."""
+        with open(fname, 'rb') as fid :
+            return pickle.load(fid)
 
 
 ######################################################################
 # functions -- plotting
 ######################################################################
 
+def _finish_figure(figures, name) :
+    """Shows the current figure, or saves it as figures/name.png and closes it."""
+    import matplotlib.pyplot as plt
+    if figures is None :
+        plt.show()
+    else :
+        plt.savefig(os.path.join(figures, name + '.png'))
+        plt.close()
+
+
 def lineplot(x, y, label):
     """
     Make a line plot.
@@ -436,13 +2868,17 @@ def lineplot(x, y, label):
         label        -- string, label for legend
     """
     
+    # matplotlib is imported on first use, so that loading a model or
+    # scoring tweets does not pay for it
+    import matplotlib.pyplot as plt
+    
     xx = range(len(x))
     plt.plot(xx, y, linestyle='-', linewidth=2, label=label)
     plt.xticks(xx, x)    
     
 
 
-def plot_results(metrics, classifiers, *args):
+def plot_results(metrics, classifiers, *args, **kwargs):
     """
     Make a results plot.
     
@@ -456,8 +2892,12 @@ def plot_results(metrics, classifiers, *args):
                           results for classifier 2
                           ...
                         each results is a tuple (score, lower, upper)
+        figures      -- string, directory to save the plot to (as
+                        results.png) instead of showing it (keyword only)
     """
     
+    import matplotlib.pyplot as plt
+    
     num_metrics = len(metrics)
     num_classifiers = len(args) - 1
     
@@ -503,101 +2943,212 @@ def plot_results(metrics, classifiers, *args):
     for rects in rects_list:
         autolabel(rects)
     
-    plt.show()
+    _finish_figure(kwargs.get('figures'), 'results')
 
 
 ######################################################################
 # main
 ######################################################################
  
-def main() :
-    # read the tweets and its labels
-    dictionary = extract_dictionary('../data/tweets.txt')
-    test_extract_dictionary(dictionary)
-    X = extract_feature_vectors('../data/tweets.txt', dictionary)
-    test_extract_feature_vectors(X)
-    y = read_vector_file('../data/labels.txt')
+# stages of a run of main, in order
+STAGES = ["extract", "tune", "evaluate", "score"]
+
+def main(argv=None) :
+    """
+    Runs the experiment, or selected stages of it:
+    
+        python twitter.py [--stages extract,tune,evaluate,score]
+                          [--figures DIR | --no-figures] [--no-checks]
+                          [--checkpoint FILE]
+                          [--report FILE [--memory] [--profile DIR]]
+    
+    extract builds (or loads the cached) features, tune runs the linear and
+    RBF sweeps, evaluate trains the final classifiers and bootstraps their
+    test performance, and score saves the RBF-SVM and scores the held-out
+    tweets. Every stage after extract loads the features itself, so stages
+    can be run on their own. With --figures or --no-figures, no window is
+    opened and matplotlib is not imported unless figures are saved, so a
+    run works without a display.
+    
+    With --checkpoint, the scores of the tune stage are appended to FILE as
+    each job finishes, and a rerun with the same FILE resumes where the
+    last one stopped (see Checkpoint and progress_main).
     
-    # shuffle data (since file has tweets ordered by movie)
-    X, y = shuffle(X, y, random_state=0)
+    With --report, every stage is timed and a JSON report of the stages,
+    timers and counters is written to FILE.
+    """
+    
+    parser = argparse.ArgumentParser(prog='twitter.py',
+                                     description='Tune and evaluate SVMs on the tweets.')
+    parser.add_argument('--stages', type=lambda text: text.split(','),
+                        default=["extract", "tune", "evaluate"],
+                        help='comma-separated stages among %s (default: extract,tune,evaluate)'
+                             % ','.join(STAGES))
+    figures = parser.add_mutually_exclusive_group()
+    figures.add_argument('--figures', metavar='DIR',
+                         help='save figures to DIR instead of showing them')
+    figures.add_argument('--no-figures', action='store_true',
+                         help='do not draw figures')
+    parser.add_argument('--no-checks', action='store_true',
+                        help='skip the dictionary, feature and metric checks')
+    parser.add_argument('--model', metavar='DIR', default='../data/model',
+                        help='directory the score stage saves the RBF-SVM to')
+    parser.add_argument('--held-out', metavar='FILE', default='../data/held_out_tweets.txt',
+                        help='tweets scored by the score stage')
+    parser.add_argument('--answer', metavar='FILE', default='../data/yjw_twitter.txt',
+                        help='decision values written by the score stage')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='record CV scores in FILE as they finish, and skip '
+                             'the jobs it already holds')
+    parser.add_argument('--report', metavar='FILE',
+                        help='write a JSON report of timings and counters to FILE')
+    parser.add_argument('--memory', action='store_true',
+                        help='record the peak memory of every stage')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='write a cProfile capture of every stage to DIR')
+    args = parser.parse_args(argv)
+    for stage in args.stages :
+        if stage not in STAGES :
+            parser.error('unknown stage %r' % stage)
+    if (args.memory or args.profile) and not args.report :
+        parser.error('--memory and --profile require --report')
+    if args.report :
+        PROFILER.enable(memory=args.memory, profile_dir=args.profile)
+    
+    plot = not args.no_figures
+    if args.figures is not None :
+        # render off-screen, so that saving figures does not need a display
+        import matplotlib
+        matplotlib.use('Agg')
+        if not os.path.isdir(args.figures) :
+            os.makedirs(args.figures)
+    
+    from sklearn.dummy import DummyClassifier
+    from sklearn.svm import SVC
+    from sklearn.model_selection import StratifiedKFold
+    
+    # read the tweets and its labels (cached across runs, and memory-mapped
+    # from the cache)
+    with PROFILER.stage('extract') :
+        store = FeatureStore('../data/cache', mmap=True)
+        dictionary, X = store.load('../data/tweets.txt')
+        vocab = Vocabulary(sorted(dictionary, key=dictionary.get))
+        if not args.no_checks :
+            test_extract_dictionary(dictionary)
+            test_extract_feature_vectors(X)
+        y = read_vector_file('../data/labels.txt', dtype=np.int8)
+    
+    # shuffle data (since file has tweets ordered by movie); only the order
+    # is shuffled, so X is never copied as a whole
+    order = shuffle_indices(X.shape[0], random_state=0)
     
     # set random seed
     np.random.seed(1234)
     
     # split the data into training (training + cross-validation) and testing set
-    X_train, X_test = X[:560], X[560:]
-    y_train, y_test = y[:560], y[560:]
+    train_rows, test_rows = order[:560], order[560:]
+    X_train, X_test = X[train_rows], X[test_rows]
+    y_train, y_test = y[train_rows], y[test_rows]
     
  
-    metric_list = ["accuracy", "f1_score", "auroc", "precision", "sensitivity", "specificity"]
+    metric_list = METRICS
 
-    test_performance()
+    if not args.no_checks :
+        test_performance()
     
-    # part 2b: create stratified folds (5-fold CV)
-    kf = StratifiedKFold(5) 
-    ## part 2d: for each metric, select optimal hyperparameter for linear-kernel SVM using CV
-    for metric in metric_list:
-        print select_param_linear(X_train, y_train, kf, metric)
-    
-    plt.legend(metric_list, loc='lower right')
-    plt.ylabel('Metric')
-    plt.xlabel('C  value')
-    plt.title("Graph of various metrics while varying C")
-    plt.show()
-    # part 3c: for each metric, select optimal hyperparameter for RBF-SVM using CV
-    kf = StratifiedKFold(5)
-
-    for metric in metric_list :
-        score, best_C, best_gamma = select_param_rbf(X_train, y_train, kf, metric)
+    if "tune" in args.stages :
+        # part 2b: create stratified folds (5-fold CV), split once and shared by
+        #          every sweep below; the sweeps train on the kernel cache and
+        #          only read the fold indices, so the blocks are not sliced
+        with PROFILER.stage('folds') :
+            kf = FoldPlan(X, y, StratifiedKFold(5), materialize=False, index=train_rows)
+            # kernels of the training set, shared by the linear and RBF sweeps
+            kernel_cache = KernelCache(X_train)
+            checkpoint = None if args.checkpoint is None else Checkpoint(args.checkpoint)
+        ## part 2d: for each metric, select optimal hyperparameter for linear-kernel SVM using CV
+        with PROFILER.stage('linear_sweep') :
+            print select_param_linear(X_train, y_train, kf, metric_list, plot=plot, n_jobs=-1,
+                                      kernel_cache=kernel_cache, checkpoint=checkpoint)
+        
+        if plot :
+            with PROFILER.stage('plot') :
+                import matplotlib.pyplot as plt
+                plt.legend(metric_list, loc='lower right')
+                plt.ylabel('Metric')
+                plt.xlabel('C  value')
+                plt.title("Graph of various metrics while varying C")
+                _finish_figure(args.figures, 'linear_sweep')
+        # part 3c: for each metric, select optimal hyperparameter for RBF-SVM using CV
+        with PROFILER.stage('rbf_sweep') :
+            for score, best_C, best_gamma in select_param_rbf(X_train, y_train, kf, metric_list, n_jobs=-1,
+                                                                kernel_cache=kernel_cache,
+                                                                checkpoint=checkpoint) :
+                print score, best_C, best_gamma
 
     # part 4a: train linear- and RBF-kernel SVMs with selected hyperparameters
-    dummy_clf = DummyClassifier(strategy = 'most_frequent')
-    dummy_clf.fit(X_train, y_train)
-    linearsvm_clf = SVC(1.0, kernel = 'linear')
-    linearsvm_clf.fit(X_train, y_train)
-    rbfsvm_clf = SVC(kernel='rbf', C=100.0, gamma=0.02)
-    rbfsvm_clf.fit(X_train, y_train)
-
-    classifiers = [dummy_clf, linearsvm_clf, rbfsvm_clf]
-
-    # part 4c: use bootstrapping to report performance on test data
-    #          use plot_results(...) to make plot
-    results = [ [0 for i in range(6)] for i in range(3)]
-
-    for i in range(3) :
-        for j in range(6) :
-            results[i][j] = performance_CI(classifiers[i], X_test, y_test, metric_list[j])
-
-    plot_results(metric_list, ["linear", "rbf"], results[0], results[1], results[2])
-
-    # part 5: identify important features
-    # we know C = 1.0 is the best value 
-    C_max = 1.0
-    clf = SVC(C_max, kernel = 'linear')
-    clf.fit(X_train, y_train)
-    print np.argsort(clf.coef_[0])[:20]
-    print np.argsort(clf.coef_[0])[-20:]
-    negindicies = [493,   32,  965,  905,  547, 1747,  196,   98,    0,  664]
-    for index in negindicies:
-        word = dictionary.keys()[dictionary.values().index(index)]
-        print word, "   ",  clf.coef_[0][index]
-
-    posIndicies = [61, 236, 583, 107, 169, 24 ,847, 507, 221, 128]
-    for index in posIndicies:
-        word = dictionary.keys()[dictionary.values().index(index)]
-        print word, "   ",  clf.coef_[0][index]
+    rbfsvm_clf = None
+    if "evaluate" in args.stages :
+        # every SVC fit draws from the global random state, so reseed to make
+        # the bootstrap independent of how many fits the tune stage ran
+        # in this process (e.g. with --checkpoint, or several workers)
+        np.random.seed(1234)
+        with PROFILER.stage('train') :
+            dummy_clf = DummyClassifier(strategy = 'most_frequent')
+            dummy_clf.fit(X_train, y_train)
+            linearsvm_clf = SVC(1.0, kernel = 'linear')
+            linearsvm_clf.fit(X_train, y_train)
+            rbfsvm_clf = SVC(kernel='rbf', C=100.0, gamma=0.02)
+            rbfsvm_clf.fit(X_train, y_train)
+
+        classifiers = [dummy_clf, linearsvm_clf, rbfsvm_clf]
+
+        # part 4c: use bootstrapping to report performance on test data
+        #          use plot_results(...) to make plot
+        with PROFILER.stage('bootstrap') :
+            results = [performance_CI(clf, X_test, y_test, metric_list) for clf in classifiers]
+
+        if plot :
+            with PROFILER.stage('plot_results') :
+                plot_results(metric_list, ["linear", "rbf"], results[0], results[1], results[2],
+                             figures=args.figures)
+        else :
+            for name, result in zip(["baseline", "linear", "rbf"], results) :
+                print name, result
+
+        # part 5: identify important features
+        # we know C = 1.0 is the best value 
+        with PROFILER.stage('features') :
+            C_max = 1.0
+            clf = SVC(C_max, kernel = 'linear')
+            clf.fit(X_train, y_train)
+            coef, intercept = linear_weights(clf)
+            positive, negative = top_features(coef, vocab, 10)
+        for word, weight in negative:
+            print word, "   ",  weight
+
+        for word, weight in positive:
+            print word, "   ",  weight
     
     ### ========== TODO : START ========== ###
     # Twitter contest
-    # uncomment out the following, and be sure to change the filename
-    """
-    X_held = extract_feature_vectors('../data/held_out_tweets.txt', dictionary)
-    # your code here
-    # y_pred = best_clf.decision_function(X_held)
-    write_label_answer(y_pred, '../data/yjw_twitter.txt')
-    """
+    if "score" in args.stages :
+        with PROFILER.stage('score') :
+            if rbfsvm_clf is None :
+                rbfsvm_clf = SVC(kernel='rbf', C=100.0, gamma=0.02)
+                rbfsvm_clf.fit(X_train, y_train)
+            save_model(args.model, rbfsvm_clf, dictionary)
+            clf, word_list = load_model(args.model)
+            print score_file(clf, word_list, args.held_out, args.answer), "tweets scored"
     ### ========== TODO : END ========== ###
+    
+    if args.report :
+        PROFILER.write(args.report)
 
 
 if __name__ == "__main__" :
-    main()
\ No newline at end of file
+    if sys.argv[1:2] == ['score'] :
+        score_main(sys.argv[2:])
+    elif sys.argv[1:2] == ['progress'] :
+        progress_main(sys.argv[2:])
+    else :
+        main(sys.argv[1:])
\ No newline at end of file